@@ -1,32 +1,22 @@
-from utils import *
 import heapq
 import math
+from instrumentation import instrumented
 
+# Moves to the 8 neighbour cells: (row offset, column offset, cost)
+MOVES = [(-1, -1, math.sqrt(2)), (0, -1, 1), (1, -1, math.sqrt(2)), (-1, 0, 1),
+         (1, 0, 1), (-1, 1, math.sqrt(2)), (0, 1, 1), (1, 1, math.sqrt(2))]
 
-class Node:
+
+def octileDistance(pointA, pointB):
     """
-    Auxiliary structure to help to the A* algorithm
+    Cost of the shortest path between 2 points in a grid with diagonal moves of cost sqrt(2) and straight moves of cost 1.
     """
-    def __init__(self, pos, parent, h=0, cost=0):
-        self.position = pos
-        self.parent = parent
-        self.cost = cost
-        self.heurisitic = h
-
-    def __eq__(self, other):
-        return self.position == other.position
-
-    # Sort nodes
-    def __lt__(self, other):
-        # The processed cost is reduced, in order to increase the A* algorithm's efficiency.
-        # Since this algorithm is running in a grid, the optimal solution is guaranteed.
-        processedCost = 0.8
-        return (processedCost * self.cost + self.heurisitic) < (processedCost * other.cost + other.heurisitic)
-
-    def __repr__(self):
-        return '({0},{1})'.format(self.position, self.cost + self.heurisitic)
+    dx = abs(pointA[0] - pointB[0])
+    dy = abs(pointA[1] - pointB[1])
+    return dx + dy + (math.sqrt(2) - 2) * min(dx, dy)
 
 
+@instrumented("aStar")
 def aStar(blueprint, startCoord, endCoord):
     """ Calculates the shortest paths between 2 points.
         Params: startCoord - tuple
@@ -34,64 +24,61 @@ def aStar(blueprint, startCoord, endCoord):
             blueprint - class Blueprint
     """
     startCoord = tuple(startCoord)
+    endCoord = tuple(endCoord)
     # Check if start and end positions are valid
     if (not blueprint.atGrid(startCoord)) or (not blueprint.atGrid(endCoord)):
         return None
 
-    startNode = Node(startCoord, None, distance(startCoord, endCoord))
-    endNode = Node(endCoord, None, 0)
+    width, height = blueprint.width, blueprint.height
+    # Cells are identified by their flattened position
+    start = startCoord[0] * width + startCoord[1]
+    end = endCoord[0] * width + endCoord[1]
 
-    # 'open' is a priority queue with nodes to be expanded and is ordered by each node's cost
-    open = [startNode]
-    heapq.heapify(open)
+    # Best known cost to reach each cell, and the cell it was reached from
+    bestCost = {start: 0}
+    parent = {start: None}
+    # Already expanded cells
+    closed = bytearray(width * height)
 
-    # 'closed' is a list which contains the already visited nodes
-    closed = []
+    # 'open' is a priority queue ordered by estimated total cost. Ties go to the deepest cell.
+    # Entries are never updated: a better entry is pushed and the outdated ones are skipped when popped.
+    open = [(octileDistance(startCoord, endCoord), 0, start)]
 
-    # while open has at least one node
+    # while open has at least one entry
     while open:
-        currentNode = heapq.heappop(open)
-
-        # Mark node as visited
-        closed.append(currentNode)
+        _, negativeCost, current = heapq.heappop(open)
+        if closed[current]:
+            continue
 
         # If finished
-        if currentNode == endNode:
+        if current == end:
             path = []
             # Create path
-            while currentNode != startNode:
-                path.append(currentNode.position)
-                currentNode = currentNode.parent
-            path.append(currentNode.position)
+            while current is not None:
+                path.append(divmod(current, width))
+                current = parent[current]
             return path[::-1]
 
-        # Get each neighbour cell
-        neighbours = blueprint.getCellNeighbours(currentNode.position)
-        for n in neighbours:
-            # Check move cost
-            if isDiagonal(n, currentNode.position):
-                moveCost = math.sqrt(2)
-            else:
-                moveCost = 1
-
-            neighbourNode = Node(n, currentNode, distance(n, endCoord), currentNode.cost + moveCost)
+        # Mark cell as visited
+        closed[current] = 1
+        cost = -negativeCost
+        row, column = divmod(current, width)
 
-            # Node already visited
-            if neighbourNode in closed: continue
-
-            addToOpen = True
-            # Check if the neighbour already exists and, if it exists, check whether it's worth an update
-            for node in open:
-                if neighbourNode == node and neighbourNode.cost + neighbourNode.heurisitic >= node.cost + node.heurisitic:
-                    addToOpen = False
-
-            if addToOpen:
-                heapq.heappush(open, neighbourNode)
+        # Get each neighbour cell
+        for (rowOffset, columnOffset, moveCost) in MOVES:
+            neighbourRow = row + rowOffset
+            neighbourColumn = column + columnOffset
+            if not (0 <= neighbourRow < height and 0 <= neighbourColumn < width):
+                continue
+            neighbour = neighbourRow * width + neighbourColumn
+            if closed[neighbour]:
+                continue
+
+            neighbourCost = cost + moveCost
+            # Only worth adding if it improves the best known cost
+            if neighbourCost < bestCost.get(neighbour, math.inf):
+                bestCost[neighbour] = neighbourCost
+                parent[neighbour] = current
+                estimate = neighbourCost + octileDistance((neighbourRow, neighbourColumn), endCoord)
+                heapq.heappush(open, (estimate, -neighbourCost, neighbour))
     return None
-
-
-def isDiagonal(pos1, pos2):
-    """
-    Checks if 2 positions are in the same diagonal.
-    """
-    return abs(pos1[1] - pos2[1]) != 0 and abs(pos1[0] - pos2[0]) != 0
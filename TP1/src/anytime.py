@@ -0,0 +1,116 @@
+"""
+Support for running the algorithms as anytime algorithms: they stop when a budget (time and/or evaluations) runs out,
+and always have a best solution so far, whose improvements can be followed with a callback.
+Each algorithm is also a generator of steps (see 'Step'), so a driver can log, save checkpoints, plot or stop early
+without the algorithm printing anything in its loops. 'run' is the default driver.
+"""
+import collections
+import time
+
+# Event yielded by the algorithms after each iteration:
+#   - iteration: number of the iteration (its meaning depends on the algorithm: move, neighbourhood, generation, ...)
+#   - bestValue: value of the best solution so far
+#   - solution: current solution. It's not a copy, and it changes in the next iteration, so it must be copied to be kept
+#   - evaluations: evaluations made by the algorithm so far
+Step = collections.namedtuple("Step", ["iteration", "bestValue", "solution", "evaluations"])
+
+
+class Budget:
+    """
+    Stopping rule of an algorithm: a time limit (in seconds) and/or a maximum number of evaluations,
+    counted by 'blueprint.evaluations'. None means no limit.
+    """
+    def __init__(self, blueprint, timeLimit=None, maxEvaluations=None):
+        self.blueprint = blueprint
+        self.timeLimit = timeLimit
+        self.maxEvaluations = maxEvaluations
+        self.deadline = None if timeLimit is None else time.time() + timeLimit
+        self.startEvaluations = blueprint.evaluations
+        self.evaluationLimit = None if maxEvaluations is None else blueprint.evaluations + maxEvaluations
+
+    def exhausted(self):
+        """
+        Checks if the algorithm must stop.
+        """
+        if self.deadline is not None and time.time() >= self.deadline:
+            return True
+        return self.evaluationLimit is not None and self.blueprint.evaluations >= self.evaluationLimit
+
+    def evaluations(self):
+        """
+        Evaluations made since the budget was created.
+        """
+        return self.blueprint.evaluations - self.startEvaluations
+
+    def progress(self):
+        """
+        Fraction of the budget used (the largest of time and evaluations), or None if there's no limit.
+        """
+        fractions = []
+        if self.deadline is not None:
+            fractions.append(1 - self.remainingTime() / self.timeLimit if self.timeLimit > 0 else 1)
+        if self.evaluationLimit is not None:
+            fractions.append(self.evaluations() / self.maxEvaluations if self.maxEvaluations > 0 else 1)
+        return max(fractions) if fractions else None
+
+    def remainingTime(self):
+        """
+        Seconds left, or None if there's no time limit.
+        """
+        return None if self.deadline is None else max(0, self.deadline - time.time())
+
+    def remainingEvaluations(self):
+        """
+        Evaluations left, or None if there's no evaluation limit.
+        """
+        return None if self.evaluationLimit is None else max(0, self.evaluationLimit - self.blueprint.evaluations)
+
+
+class BestSoFar:
+    """
+    Best solution found by an algorithm. Each improvement is reported to 'callback(solution, value)', if there's one.
+    """
+    def __init__(self, callback=None):
+        self.solution = None
+        self.value = None
+        self.callback = callback
+
+    def update(self, solution, value):
+        """
+        Keeps a copy of the solution if it's better than the best one.
+        :return: True if it's better
+        """
+        if value is None or (self.value is not None and value <= self.value):
+            return False
+        self.solution = solution.copy()
+        self.value = value
+        if self.callback is not None:
+            self.callback(self.solution, value)
+        return True
+
+
+def run(steps, callback=None, name="Solver", printInterval=1):
+    """
+    Runs an algorithm given as a generator of steps (see 'Step') until it ends.
+    Each improvement of the best value is reported to 'callback(solution, value)', with a copy of the solution, since
+    the solution of a step is the best one when the best value improves. The progress is printed at most once every
+    'printInterval' seconds.
+    :return: What the generator returns (the best solution)
+    """
+    bestValue = None
+    lastPrint = time.time()
+    while True:
+        try:
+            step = next(steps)
+        except StopIteration as stop:
+            print("{}: Done! Best value: {}".format(name, bestValue))
+            return stop.value
+
+        if step.bestValue is not None and (bestValue is None or step.bestValue > bestValue):
+            bestValue = step.bestValue
+            if callback is not None:
+                callback(step.solution.copy(), bestValue)
+        if time.time() - lastPrint >= printInterval:
+            lastPrint = time.time()
+            print("{}: iteration {}, best value {}, {} evaluations".format(name, step.iteration, bestValue,
+                                                                           step.evaluations))
@@ -0,0 +1,276 @@
+import numpy as np
+
+
+def chebyshevDistance(pointA, pointB):
+    """
+    Chebyshev distance between 2 points: the number of moves of a king between them.
+    """
+    return max(abs(pointA[0] - pointB[0]), abs(pointA[1] - pointB[1]))
+
+
+def rasterizedPath(pointA, pointB):
+    """
+    Straight line of cells between 2 points, both included. Consecutive cells are neighbours (diagonals included),
+    so the path has Chebyshev distance + 1 cells, the same as a shortest A* path (backbone cells can be walls).
+    """
+    dx = pointB[0] - pointA[0]
+    dy = pointB[1] - pointA[1]
+    steps = max(abs(dx), abs(dy))
+    if steps == 0:
+        return [tuple(pointA)]
+    # Each coordinate is rounded to the nearest cell (halves go up)
+    return [(pointA[0] + (2 * dx * k + steps) // (2 * steps), pointA[1] + (2 * dy * k + steps) // (2 * steps))
+            for k in range(steps + 1)]
+
+
+class Backbone:
+    """
+    Minimum spanning tree of the backbone position and the routers of a solution, using the Chebyshev distance,
+    which is the number of cells a backbone path needs to connect 2 positions.
+    The backbone cost is closed-form: the tree weight is the number of cells connected to the backbone (the initial
+    backbone cell excluded). The cells themselves are only generated by 'cells', for plotting and output.
+
+    Terminals (routers) can be added and removed one at a time, and the tree is updated without being rebuilt:
+        - adding a terminal finds the MST of the tree edges plus the edges from the new terminal in linear time, with
+          the insertion algorithm of Chin and Houck (each cycle closed by the new terminal drops its heaviest edge);
+        - removing a terminal reconnects the pieces of the tree with the shortest edges between them.
+    Changes made after 'checkpoint' can be undone with 'rollback', which is how moves are evaluated.
+    """
+    def __init__(self, blueprint, solution=()):
+        self.root = blueprint.backbonePosition
+        self.terminals = {}  # Number of routers in each node position
+        self.adjacency = {self.root: {}}  # Tree edges and their cost
+        self.weight = 0  # Sum of the Chebyshev distance of every tree edge
+        self.journal = None  # Inverse operations since the last checkpoint
+
+        # Build the initial tree with Prim's algorithm
+        for router in solution:
+            if router != (-1, -1):
+                self.terminals[router] = self.terminals.get(router, 0) + 1
+        nodes = list(self.adjacency) + [router for router in self.terminals if router != self.root]
+        for router in nodes[1:]:
+            self.adjacency[router] = {}
+        self.prim(nodes)
+
+    def cells(self):
+        """
+        Returns the cells connected to the backbone, excluding the initial backbone cell.
+        The tree edges are rasterized as straight lines and a cell shared by several of them is only listed once.
+        """
+        cells = {}
+        for nodeA in self.adjacency:
+            for nodeB in self.adjacency[nodeA]:
+                if nodeA < nodeB:
+                    cells.update(dict.fromkeys(rasterizedPath(nodeA, nodeB)))
+        cells.pop(self.root, None)
+        return list(cells)
+
+    def prim(self, nodes):
+        """
+        Links 'nodes' (already in the adjacency, but without edges) with Prim's algorithm.
+        """
+        if len(nodes) < 2:
+            return
+        coords = np.array(nodes)
+        inTree = np.zeros(len(nodes), dtype=bool)
+        inTree[0] = True
+        parent = np.zeros(len(nodes), dtype=np.intp)
+        bestDistance = np.max(np.abs(coords - coords[0]), axis=1)
+        bestDistance[0] = np.iinfo(bestDistance.dtype).max
+        for _ in range(len(nodes) - 1):
+            j = int(np.argmin(bestDistance))
+            self.link(nodes[parent[j]], nodes[j])
+            inTree[j] = True
+            distance = np.max(np.abs(coords - coords[j]), axis=1)
+            closer = (distance < bestDistance) & ~inTree
+            bestDistance[closer] = distance[closer]
+            parent[closer] = j
+            bestDistance[j] = np.iinfo(bestDistance.dtype).max
+
+    def link(self, nodeA, nodeB):
+        """
+        Adds a tree edge.
+        """
+        cost = chebyshevDistance(nodeA, nodeB)
+        self.adjacency[nodeA][nodeB] = cost
+        self.adjacency[nodeB][nodeA] = cost
+        self.weight += cost
+        if self.journal is not None:
+            self.journal.append((self.unlink, nodeA, nodeB))
+
+    def unlink(self, nodeA, nodeB):
+        """
+        Removes a tree edge.
+        """
+        self.weight -= self.adjacency[nodeA].pop(nodeB)
+        del self.adjacency[nodeB][nodeA]
+        if self.journal is not None:
+            self.journal.append((self.link, nodeA, nodeB))
+
+    def setTerminalCount(self, node, count):
+        """
+        Changes the number of routers in a position, keeping the journal.
+        """
+        if self.journal is not None:
+            self.journal.append((self.setTerminalCount, node, self.terminals.get(node, 0)))
+        if count == 0:
+            del self.terminals[node]
+        else:
+            self.terminals[node] = count
+
+    def addNode(self, node):
+        """
+        Adds an empty node to the adjacency, keeping the journal.
+        """
+        self.adjacency[node] = {}
+        if self.journal is not None:
+            self.journal.append((self.removeNode, node))
+
+    def removeNode(self, node):
+        """
+        Removes a node without edges from the adjacency, keeping the journal.
+        """
+        del self.adjacency[node]
+        if self.journal is not None:
+            self.journal.append((self.addNode, node))
+
+    def checkpoint(self):
+        """
+        Starts recording the changes, so they can be undone with 'rollback'.
+        """
+        self.journal = []
+
+    def rollback(self):
+        """
+        Undoes every change since the last checkpoint.
+        """
+        journal = self.journal
+        self.journal = None
+        for operation in reversed(journal):
+            operation[0](*operation[1:])
+
+    def commit(self):
+        """
+        Keeps the changes since the last checkpoint.
+        """
+        self.journal = None
+
+    def addTerminal(self, node):
+        """
+        Adds a router to the tree. The new tree is the MST of the old tree edges plus the edges from the new node,
+        found in linear time with the insertion algorithm of Chin and Houck: each subtree keeps the heaviest edge that
+        can still be replaced, and each cycle closed by the new node drops its heaviest edge.
+        """
+        count = self.terminals.get(node, 0)
+        self.setTerminalCount(node, count + 1)
+        if count > 0 or node == self.root:  # The node is already in the tree
+            return
+        self.addNode(node)
+
+        # Order the old tree from the backbone position, so children come after their parent
+        order = [self.root]
+        parent = [-1]
+        parentCost = [0]
+        index = {self.root: 0}
+        for (i, current) in enumerate(order):
+            for (child, cost) in self.adjacency[current].items():
+                if child not in index and child != node:
+                    index[child] = len(order)
+                    order.append(child)
+                    parent.append(i)
+                    parentCost.append(cost)
+
+        # 'best' is the edge (cost, child, parent) that connects each subtree to the rest of the new tree.
+        # It starts as the edge to the new node (-1 stands for the new node).
+        coords = np.array(order)
+        distances = np.maximum(np.abs(coords[:, 0] - node[0]), np.abs(coords[:, 1] - node[1])).tolist()
+        best = [(distances[i], i, -1) for i in range(len(order))]
+        kept = []
+        for i in range(len(order) - 1, 0, -1):
+            p = parent[i]
+            childEdge = (parentCost[i], i, p)
+            heavier, lighter = (best[i], childEdge) if best[i][0] > childEdge[0] else (childEdge, best[i])
+            kept.append(lighter)
+            if heavier[0] < best[p][0]:
+                best[p] = heavier
+        kept.append(best[0])
+
+        # Only the edges that changed are unlinked or linked
+        kept = set((i, j) for (_, i, j) in kept)
+        for i in range(1, len(order)):
+            if (i, parent[i]) not in kept:
+                self.unlink(order[i], order[parent[i]])
+        for (i, j) in kept:
+            if j == -1:
+                self.link(order[i], node)
+
+    def removeTerminal(self, node):
+        """
+        Removes a router from the tree. The pieces left by the node are reconnected with the shortest edges between them.
+        """
+        count = self.terminals[node]
+        self.setTerminalCount(node, count - 1)
+        if count > 1 or node == self.root:  # The node stays in the tree
+            return
+
+        neighbours = list(self.adjacency[node])
+        for neighbour in neighbours:
+            self.unlink(node, neighbour)
+        self.removeNode(node)
+        if len(neighbours) < 2:
+            return
+
+        # Find the pieces of the tree
+        components = []
+        label = {}
+        for start in neighbours:
+            component = [start]
+            label[start] = len(components)
+            for current in component:
+                for nextNode in self.adjacency[current]:
+                    if nextNode not in label:
+                        label[nextNode] = len(components)
+                        component.append(nextNode)
+            components.append(component)
+
+        # Shortest edge between each pair of pieces, measured from the smaller piece
+        components.sort(key=len)
+        for i, component in enumerate(components):
+            for nodeA in component:
+                label[nodeA] = i
+        candidates = []
+        for i in range(len(components) - 1):
+            others = [nodeB for component in components[i + 1:] for nodeB in component]
+            otherLabels = np.array([label[nodeB] for nodeB in others])
+            coordsA = np.array(components[i])
+            coordsB = np.array(others)
+            distances = np.maximum(np.abs(coordsA[:, None, 0] - coordsB[None, :, 0]),
+                                   np.abs(coordsA[:, None, 1] - coordsB[None, :, 1]))
+            for j in range(i + 1, len(components)):
+                block = distances[:, otherLabels == j]
+                a, b = np.unravel_index(np.argmin(block), block.shape)
+                candidates.append((int(block[a, b]), components[i][a], components[j][b], i, j))
+        candidates.sort()
+
+        # Kruskal over the pieces
+        pieces = list(range(len(components)))
+
+        def find(x):
+            while pieces[x] != x:
+                x = pieces[x]
+            return x
+
+        for (_, nodeA, nodeB, i, j) in candidates:
+            rootI, rootJ = find(i), find(j)
+            if rootI != rootJ:
+                pieces[rootI] = rootJ
+                self.link(nodeA, nodeB)
+
+    def moveTerminal(self, oldNode, newNode):
+        """
+        Moves a router. (-1, -1) stands for no router, so this also adds or removes routers.
+        """
+        if newNode != (-1, -1):
+            self.addTerminal(newNode)
+        if oldNode != (-1, -1):
+            self.removeTerminal(oldNode)
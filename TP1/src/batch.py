@@ -0,0 +1,231 @@
+"""
+Runs the algorithms over several inputs and seeds, without prompts, and writes a summary of the results.
+Example (in the src directory):
+    python batch.py ../inputs/example.in ../inputs/charleston_road.in --solvers annealing tabu --seeds 1 2 3
+                    --time-limit 60 --summary ../out/summary.jsonl
+"""
+import argparse
+import contextlib
+import cProfile
+import csv
+import json
+import os
+import random
+import sys
+import time
+import matplotlib
+
+matplotlib.use("Agg")  # No windows: figures are only saved
+
+import blueprint as bp
+import geneticAlgorithm
+import greedy
+import hillClimbing
+import instrumentation
+import simulatedAnnealing
+import tabuSearch
+import utils
+
+# Each algorithm, by the name used in the output directories: (needs an initial solution, function)
+# The functions receive the blueprint, the initial solution, the number of workers and, as keywords,
+# the budget (timeLimit, maxEvaluations) and the callback of the improvements.
+SOLVERS = {
+    "annealing": (True, lambda blueprint, solution, workers, **budget:
+                  simulatedAnnealing.simulatedAnnealing(blueprint, solution, **budget)),
+    "annealing_acceptance": (True, lambda blueprint, solution, workers, **budget:
+                             simulatedAnnealing.simulatedAnnealing(blueprint, solution, schedule="acceptance",
+                                                                   reheats=3, **budget)),
+    "annealing_lam": (True, lambda blueprint, solution, workers, **budget:
+                      simulatedAnnealing.simulatedAnnealing(blueprint, solution, schedule="lam", reheats=3, **budget)),
+    "annealing_relocate": (True, lambda blueprint, solution, workers, **budget:
+                           simulatedAnnealing.simulatedAnnealing(blueprint, solution, relocate=0.1, **budget)),
+    "parallel_tempering": (True, lambda blueprint, solution, workers, **budget:
+                           simulatedAnnealing.parallelTempering(blueprint, solution, workers, **budget)),
+    "hill_climbing_regular": (True, lambda blueprint, solution, workers, **budget:
+                              hillClimbing.hillClimbing(blueprint, solution, **budget)),
+    "hill_climbing_steepest": (True, lambda blueprint, solution, workers, **budget:
+                               hillClimbing.hillClimbingSteepestAscent(blueprint, solution, workers, **budget)),
+    "tabu": (True, lambda blueprint, solution, workers, **budget:
+             tabuSearch.tabuSearch(blueprint, solution, workers, **budget)),
+    "genetic": (False, lambda blueprint, solution, workers, **budget:
+                geneticAlgorithm.geneticAlgorithm(blueprint, **budget)),
+    "genetic_islands": (False, lambda blueprint, solution, workers, **budget:
+                        geneticAlgorithm.islandGeneticAlgorithm(blueprint, workers, **budget)),
+    "greedy": (False, lambda blueprint, solution, workers, **budget:
+               greedy.greedySolution(blueprint, **budget)),
+}
+
+# Columns of the summary
+FIELDS = ["input", "solver", "seed", "initial", "timeLimit", "maxEvaluations", "value", "remainingBudget", "routers",
+          "runtime", "evaluations", "evaluationsPerSecond"]
+
+
+def parseArguments(arguments=None):
+    parser = argparse.ArgumentParser(description="Router placement: runs algorithms over several inputs, without prompts.")
+    parser.add_argument("inputs", nargs="+", help="input files (.in)")
+    parser.add_argument("--solvers", nargs="+", choices=sorted(SOLVERS), default=["annealing"],
+                        help="algorithms to run (default: annealing)")
+    parser.add_argument("--seeds", nargs="+", type=int, default=[0], help="random seeds, one run per seed (default: 0)")
+    parser.add_argument("--time-limit", type=float, default=None,
+                        help="time budget of each run, in seconds, initial solution included (default: no limit)")
+    parser.add_argument("--max-evaluations", type=int, default=None,
+                        help="evaluation budget of each run, initial solution included (default: no limit)")
+    parser.add_argument("--progress", action="store_true", help="print each improvement of the best solution")
+    parser.add_argument("--initial", choices=["random", "greedy"], default="random",
+                        help="initial solution of the local search algorithms (default: random)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="processes used by the parallel algorithms (default: number of CPUs)")
+    parser.add_argument("--summary", default=None,
+                        help="summary file, JSON lines or CSV according to its extension (default: JSON lines to stdout)")
+    parser.add_argument("--output-dir", default=None,
+                        help="directory of the solution files, <output-dir>/<input>/<solver>-<seed>.txt (default: none)")
+    parser.add_argument("--plot", action="store_true", help="also save the figure of each solution (needs --output-dir)")
+    parser.add_argument("--cache-dir", default=None, help="on-disk cache of the maps (default: none)")
+    parser.add_argument("--verbose", action="store_true", help="show the output of the algorithms")
+    parser.add_argument("--profile", action="store_true",
+                        help="print the time spent in each phase (coverage, MST, A*, value, ...) and the cache hit rates")
+    parser.add_argument("--profile-output", default=None,
+                        help="directory of the profiler output of each run, <input>-<solver>-<seed>.prof (or .html)")
+    parser.add_argument("--profiler", choices=["cprofile", "pyinstrument"], default="cprofile",
+                        help="profiler used by --profile-output (default: cprofile; pyinstrument must be installed)")
+    return parser.parse_args(arguments)
+
+
+def runSolver(blueprint, solver, seed, initial="random", timeLimit=None, workers=1, maxEvaluations=None, callback=None):
+    """
+    Runs one algorithm on a blueprint, with a budget of time and/or evaluations.
+    Each improvement of the best solution is reported to 'callback(solution, value)'.
+    :return: The solution found and a dictionary with the results
+    """
+    random.seed(seed)
+    blueprint.evaluations = 0
+    (needsInitialSolution, function) = SOLVERS[solver]
+
+    startTime = time.time()
+    solution = None
+    if needsInitialSolution:
+        if initial == "greedy":
+            solution = greedy.greedySolution(blueprint, timeLimit, maxEvaluations)
+        else:
+            solution = utils.generateSolution(blueprint, timeLimit, maxEvaluations)
+    remainingTime = None if timeLimit is None else max(0, timeLimit - (time.time() - startTime))
+    remainingEvaluations = None if maxEvaluations is None else max(0, maxEvaluations - blueprint.evaluations)
+    solution = function(blueprint, solution, workers, timeLimit=remainingTime, maxEvaluations=remainingEvaluations,
+                        callback=callback)
+    runtime = time.time() - startTime
+    evaluations = blueprint.evaluations
+
+    return solution, {
+        "solver": solver,
+        "seed": seed,
+        "initial": initial if needsInitialSolution else None,
+        "timeLimit": timeLimit,
+        "maxEvaluations": maxEvaluations,
+        "value": utils.value(blueprint, solution),
+        "remainingBudget": utils.remainingBudget(blueprint, solution),
+        "routers": utils.routersPlaced(solution),
+        "runtime": runtime,
+        "evaluations": evaluations,
+        "evaluationsPerSecond": evaluations / runtime if runtime > 0 else None,
+    }
+
+
+@contextlib.contextmanager
+def profiled(path, profiler="cprofile"):
+    """
+    Profiles the code inside a 'with' statement, and saves the result to 'path' (nothing is done if it's None):
+    cProfile statistics (.prof, see the pstats module) or a pyinstrument report (.html).
+    """
+    if path is None:
+        yield
+    elif profiler == "pyinstrument":
+        from pyinstrument import Profiler  # Optional dependency
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            with open(path + ".html", "w") as file:
+                file.write(profiler.output_html())
+    else:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path + ".prof")
+
+
+def writeSummary(results, filename=None):
+    """
+    Writes the results, as CSV if 'filename' ends with .csv, or as JSON lines otherwise (to stdout if there's no file).
+    """
+    with contextlib.ExitStack() as stack:
+        file = sys.stdout if filename is None else stack.enter_context(open(filename, "w", newline=""))
+        if filename is not None and filename.endswith(".csv"):
+            writer = csv.DictWriter(file, fieldnames=FIELDS, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(results)
+        else:
+            for result in results:
+                file.write(json.dumps(result) + "\n")
+
+
+def main(arguments=None):
+    args = parseArguments(arguments)
+    if args.plot and args.output_dir is None:
+        sys.exit("--plot needs --output-dir")
+    if args.profile_output is not None:
+        os.makedirs(args.profile_output, exist_ok=True)
+    instrumentation.enable(args.profile)
+
+    results = []
+    devnull = open(os.devnull, "w")
+    for inputFile in args.inputs:
+        blueprint = bp.Blueprint(inputFile, cacheDirectory=args.cache_dir)
+        blueprint.precomputeCoverage(args.workers)
+        inputName = os.path.splitext(os.path.basename(inputFile))[0]
+
+        for solver in args.solvers:
+            for seed in args.seeds:
+                output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(devnull)
+                profilePath = None
+                if args.profile_output is not None:
+                    profilePath = os.path.join(args.profile_output, "{}-{}-{}".format(inputName, solver, seed))
+                instrumentation.reset()
+                blueprint.resetCacheStats()
+                callback = None
+                if args.progress:
+                    startTime = time.time()
+                    callback = lambda solution, solutionValue: print("{:10.2f}s value {}".format(
+                        time.time() - startTime, solutionValue), file=sys.stderr)
+                with output, profiled(profilePath, args.profiler):
+                    solution, result = runSolver(blueprint, solver, seed, args.initial, args.time_limit, args.workers,
+                                                 args.max_evaluations, callback)
+                result = dict(input=inputFile, **result)
+                if args.profile:
+                    result["phases"] = instrumentation.report()
+                    result["caches"] = blueprint.cacheStats()
+                results.append(result)
+                print("{} {} seed {}: value {}, {:.2f}s, {:.0f} evaluations/s".format(
+                    inputName, solver, seed, result["value"], result["runtime"], result["evaluationsPerSecond"] or 0),
+                    file=sys.stderr)
+                if args.profile:
+                    instrumentation.printReport(result["runtime"], result["caches"], file=sys.stderr)
+
+                if args.output_dir is not None:
+                    directory = os.path.join(args.output_dir, inputName)
+                    os.makedirs(directory, exist_ok=True)
+                    path = os.path.join(directory, solver + "-" + str(seed))
+                    utils.printSolToFile(solution, result["runtime"], blueprint, path + ".txt")
+                    if args.plot:
+                        blueprint.plotSolution(solution, path + ".png", show=False)
+
+    devnull.close()
+    writeSummary(results, args.summary)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+Benchmarks of the algorithms (value, evaluations per second and peak memory of each run, with fixed seeds and time
+limits) and of the hot functions in isolation. Results can be saved as a baseline and later runs compared against it.
+Example (in the src directory):
+    python bench.py --save ../out/baseline.json
+    python bench.py --baseline ../out/baseline.json
+"""
+import argparse
+import contextlib
+import glob
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import random
+import sys
+import time
+import traceback
+import matplotlib
+
+matplotlib.use("Agg")
+
+import aStar
+import batch
+import blueprint as bp
+import kruskal
+import utils
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Algorithms benchmarked by default
+SOLVERS = ["annealing", "hill_climbing_regular", "hill_climbing_steepest", "tabu", "genetic"]
+# Input of the function benchmarks
+PRIMITIVES_INPUT = "../inputs/charleston_road.in"
+# Seconds a run can take beyond its time limit (reading the map, precomputing the coverage, ...) before it's stopped
+TIMEOUT_GRACE = 120
+
+
+def peakMemory():
+    """
+    Peak resident memory of this process, in MB (None if it can't be measured).
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10  # Bytes on macOS, KB on Linux
+
+
+def isolatedTarget(results, function, args):
+    """
+    Runs in the new process of 'runIsolated': puts (True, result) in 'results', or (False, traceback) if it fails.
+    """
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            result = function(*args)
+    except BaseException:
+        results.put((False, traceback.format_exc()))
+    else:
+        results.put((True, result))
+
+
+def runIsolated(function, *args, timeout=None):
+    """
+    Runs a function in a new process, so its peak memory isn't mixed with other runs.
+    The process isn't a daemon, so the algorithms can start their own pools.
+    Raises RuntimeError, with the traceback of the process, if the function fails or the process dies, and terminates
+    the process and raises RuntimeError if it takes more than 'timeout' seconds.
+    """
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=isolatedTarget, args=(results, function, args))
+    process.start()
+    deadline = None if timeout is None else time.time() + timeout
+    while True:
+        try:
+            (ok, result) = results.get(timeout=1)
+            break
+        except queue.Empty:
+            # The process can die without putting anything in the queue (killed, out of memory, ...)
+            if not process.is_alive() and results.empty():
+                process.join()
+                raise RuntimeError("{} died with exit code {}".format(function.__name__, process.exitcode))
+            if deadline is not None and time.time() > deadline:
+                process.terminate()
+                process.join()
+                raise RuntimeError("{} timed out after {:.0f}s".format(function.__name__, timeout))
+    process.join()
+    if not ok:
+        raise RuntimeError("{} failed:\n{}".format(function.__name__, result))
+    return result
+
+
+def benchmarkSolver(inputFile, solver, seed, timeLimit, workers, cacheDirectory):
+    """
+    Runs one algorithm (in its own process, see 'runIsolated').
+    """
+    blueprint = bp.Blueprint(inputFile, cacheDirectory=cacheDirectory)
+    blueprint.precomputeCoverage(workers)
+    (_, result) = batch.runSolver(blueprint, solver, seed, timeLimit=timeLimit, workers=workers)
+    result["input"] = os.path.basename(inputFile)
+    result["peakMemory"] = peakMemory()
+    return result
+
+
+def timeCalls(function, arguments, repeats=3, reset=None):
+    """
+    Calls a function once for each element of 'arguments', 'repeats' times, calling 'reset' before each repetition.
+    :return: Seconds per call, in the fastest repetition
+    """
+    best = None
+    for _ in range(repeats):
+        if reset is not None:
+            reset()
+        startTime = time.perf_counter()
+        for argument in arguments:
+            function(*argument)
+        seconds = (time.perf_counter() - startTime) / len(arguments)
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def benchmarkPrimitives(inputFile, calls, seed):
+    """
+    Times the hot functions in isolation, with cold caches: coverage of a router, A* between 2 positions,
+    Kruskal over the complete graph of a solution, and the value of a solution.
+    :return: Dictionary with the seconds per call of each function
+    """
+    random.seed(seed)
+    blueprint = bp.Blueprint(inputFile)
+    positions = blueprint.validPositions
+    maxRouters = min(blueprint.getMaxRouters(), 100)
+    results = {}
+
+    routers = [(random.choice(positions),) for _ in range(calls)]
+    results["getCellCoverage"] = timeCalls(blueprint.getCellCoverage, routers)
+
+    pairs = []
+    for _ in range(max(1, calls // 10)):  # A* is much slower than the others
+        start = random.choice(positions)
+        end = (min(blueprint.height - 1, start[0] + random.randint(-20, 20)),
+               min(blueprint.width - 1, start[1] + random.randint(-20, 20)))
+        pairs.append((blueprint, start, (max(0, end[0]), max(0, end[1]))))
+    results["aStar"] = timeCalls(aStar.aStar, pairs)
+
+    # Kruskal changes the nodes, so each repetition has new graphs
+    solutions = [random.sample(positions, maxRouters) for _ in range(max(1, calls // 10))]
+    graphs = []
+
+    def buildGraphs():
+        graphs[:] = [(kruskal.buildGraphWithSolution(solution, blueprint.backbonePosition),) for solution in solutions]
+    results["Graph.kruskal"] = timeCalls(kruskal.Graph.kruskal, graphs, reset=buildGraphs)
+
+    results["value"] = timeCalls(utils.value, [(blueprint, solution) for solution in solutions], reset=blueprint.reset)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Prints the changes against a baseline. Higher values and evaluations per second are better, lower times are better.
+    :return: Number of regressions beyond 'tolerance' (a fraction)
+    """
+    regressions = 0
+    key = lambda result: (result["input"], result["solver"], result["seed"])
+    baselineRuns = {key(result): result for result in baseline.get("solvers", [])}
+
+    def report(name, old, new, higherIsBetter):
+        nonlocal regressions
+        if old is None or new is None or old == 0:
+            return
+        change = new / old - 1
+        worse = change < -tolerance if higherIsBetter else change > tolerance
+        regressions += worse
+        print("{:60} {:>16.6g} {:>16.6g} {:>+8.1%}{}".format(name, old, new, change, "  REGRESSION" if worse else ""))
+
+    print("{:60} {:>16} {:>16} {:>8}".format("", "baseline", "current", "change"))
+    for result in results.get("solvers", []):
+        old = baselineRuns.get(key(result))
+        if old is None:
+            continue
+        name = "{} {} seed {}".format(*key(result))
+        report(name + ": value", old["value"], result["value"], True)
+        report(name + ": evaluations/s", old["evaluationsPerSecond"], result["evaluationsPerSecond"], True)
+        report(name + ": peak memory (MB)", old.get("peakMemory"), result.get("peakMemory"), False)
+    for (name, seconds) in results.get("primitives", {}).items():
+        report(name + ": seconds per call", baseline.get("primitives", {}).get(name), seconds, False)
+    return regressions
+
+
+def parseArguments(arguments=None):
+    parser = argparse.ArgumentParser(description="Router placement: benchmarks of the algorithms and hot functions.")
+    parser.add_argument("--inputs", nargs="+", default=sorted(glob.glob("../inputs/*.in")),
+                        help="input files (default: every file in ../inputs)")
+    parser.add_argument("--solvers", nargs="+", choices=sorted(batch.SOLVERS), default=SOLVERS,
+                        help="algorithms to run (default: " + " ".join(SOLVERS) + ")")
+    parser.add_argument("--seeds", nargs="+", type=int, default=[0], help="random seeds (default: 0)")
+    parser.add_argument("--time-limit", type=float, default=10, help="time limit of each run, in seconds (default: 10)")
+    parser.add_argument("--workers", type=int, default=1, help="processes used by the parallel algorithms (default: 1)")
+    parser.add_argument("--cache-dir", default="../cache", help="on-disk cache of the maps (default: ../cache)")
+    parser.add_argument("--calls", type=int, default=1000, help="calls of each hot function (default: 1000)")
+    parser.add_argument("--primitives-input", default=PRIMITIVES_INPUT,
+                        help="input of the hot function benchmarks (default: " + PRIMITIVES_INPUT + ")")
+    parser.add_argument("--skip-solvers", action="store_true", help="only benchmark the hot functions")
+    parser.add_argument("--skip-primitives", action="store_true", help="only benchmark the algorithms")
+    parser.add_argument("--save", default=None, help="saves the results to this file (JSON)")
+    parser.add_argument("--baseline", default=None, help="compares the results against this file (JSON)")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="relative change that counts as a regression (default: 0.1)")
+    return parser.parse_args(arguments)
+
+
+def main(arguments=None):
+    args = parseArguments(arguments)
+    results = {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count(),
+               "timeLimit": args.time_limit, "solvers": [], "primitives": {}}
+
+    if not args.skip_solvers:
+        for inputFile in args.inputs:
+            for solver in args.solvers:
+                for seed in args.seeds:
+                    try:
+                        result = runIsolated(benchmarkSolver, inputFile, solver, seed, args.time_limit, args.workers,
+                                             args.cache_dir, timeout=args.time_limit + TIMEOUT_GRACE)
+                    except RuntimeError as error:
+                        # A failed run is recorded without results, and the other runs go on
+                        results["solvers"].append({"input": os.path.basename(inputFile), "solver": solver, "seed": seed,
+                                                   "error": str(error), "value": None, "runtime": None,
+                                                   "evaluationsPerSecond": None, "peakMemory": None})
+                        print("{} {} seed {}: FAILED, {}".format(os.path.basename(inputFile), solver, seed, error))
+                        continue
+                    results["solvers"].append(result)
+                    print("{} {} seed {}: value {}, {:.2f}s, {:.0f} evaluations/s, peak memory {} MB".format(
+                        result["input"], solver, seed, result["value"], result["runtime"],
+                        result["evaluationsPerSecond"] or 0, result["peakMemory"]))
+
+    if not args.skip_primitives:
+        results["primitives"] = runIsolated(benchmarkPrimitives, args.primitives_input, args.calls, 0)
+        for (name, seconds) in results["primitives"].items():
+            print("{}: {:.1f} us per call".format(name, seconds * 1e6))
+
+    if args.save is not None:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.tolerance)
+        print(str(regressions) + " regressions")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
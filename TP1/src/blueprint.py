@@ -10,45 +10,144 @@ br: Row of initial cell that is already connected to the backbone
 bc: Column of initial cell that is already connected to the backbone
 """
 from utils import *
-import kruskal
+from backbone import Backbone
+from cache import LRUCache
+from instrumentation import instrumented
+import hashlib
+import mmap
+import os
+import numpy as np
+import multiprocessing
+import parallel
 import matplotlib.pyplot as plt
 
+# Cell contents, as stored in Blueprint.cells
+TARGET = ord(".")
+WALL = ord("#")
+VOID = ord("-")
+
+# Number of positions computed in each task of 'precomputeCoverage'
+COVERAGE_CHUNK = 4096
+
+# Default memory budget of the caches, in bytes
+CACHE_MEMORY = 256 * 1024 * 1024
+
+
+def parseGrid(data, start, height, width):
+    """
+    Views the grid of a map file as a 2D array of bytes, straight from the file contents (a buffer):
+    rows are one line apart, so the line breaks are skipped by the stride of the rows.
+    If the lines don't have the same length, the grid is copied line by line instead.
+    :param start: Position of the first row in 'data'
+    """
+    lineEnd = data.find(b"\n", start)
+    stride = (lineEnd if lineEnd != -1 else len(data)) - start + 1  # Length of a line, line break included
+    if height > 0 and stride > width and start + (height - 1) * stride + width <= len(data):
+        # Each row, but the last one, must be followed by a line break at the same position
+        lineBreaks = np.ndarray((height - 1,), dtype=np.uint8, buffer=data, offset=start + stride - 1,
+                                strides=(stride,))
+        if np.all(lineBreaks == ord("\n")):
+            return np.ndarray((height, width), dtype=np.uint8, buffer=data, offset=start, strides=(stride, 1))
+
+    lines = data[start:].split(b"\n")
+    rows = b"".join(lines[i][:width] for i in range(height))
+    return np.frombuffer(rows, dtype=np.uint8).reshape(height, width)
+
 
 class Blueprint:
-    def __init__(self, filename):
-        with open(filename) as file:
-            file = file.read().split("\n")  # Separated in lines
-
-            [H, W, R] = [int(x) for x in file[0].split()]
-            [Pb, Pr, B] = [int(x) for x in file[1].split()]
-            [br, bc] = [int(x) for x in file[2].split()]
-
-            self.width = W
-            self.height = H
-            self.routerRadius = R
-            self.backboneCost = Pb
-            self.routerCost = Pr
-            self.budget = B
-            self.backbonePosition = (br, bc)
-            self.msts = {}
-            self.mstPaths = {}
-            self.cellsCoverage = {}
-            self.grid = []
-            self.gridVisited = []
-            self.validPositions = []
-            self.targetCoveredCells = 0
-
-            for i in range(H):
-                row = []
-                for j in range(W):
-                    row.append(file[i + 3][j])
-                self.grid.append(row)
-
-            for i in range(self.height):
-                for j in range(self.width):
-                    if self.atGrid((i, j)) == ".":
-                        self.validPositions.append((i, j))
-                        self.targetCoveredCells += 1
+    def __init__(self, filename, cacheMemory=CACHE_MEMORY, cacheDirectory=None):
+        with open(filename, "rb") as file:
+            # The file is memory-mapped, so the grid is read straight from its bytes, without copies
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # The first 3 lines have the parameters
+        header = []
+        start = 0
+        for _ in range(3):
+            end = data.find(b"\n", start)
+            header.append([int(x) for x in data[start:end].split()])
+            start = end + 1
+        [[H, W, R], [Pb, Pr, B], [br, bc]] = header
+
+        self.width = W
+        self.height = H
+        self.routerRadius = R
+        self.backboneCost = Pb
+        self.routerCost = Pr
+        self.budget = B
+        self.backbonePosition = (br, bc)
+        # Caches, bounded by 'cacheMemory' (1/4 for the coverage and the MSTs, 1/8 for each of the others)
+        self.msts = LRUCache(maxBytes=cacheMemory // 4)
+        self.mstPaths = LRUCache(maxBytes=cacheMemory // 8)
+        self.cellsCoverage = LRUCache(maxBytes=cacheMemory // 4)
+        self.coverageIndices = LRUCache(maxBytes=cacheMemory // 8)
+        self.coverageBits = LRUCache(maxBytes=cacheMemory // 8)
+        self.fitness = LRUCache(maxBytes=cacheMemory // 8)
+        self.gridVisited = []
+        self.evaluations = 0  # Number of solutions (or moves) evaluated
+
+        # On-disk cache of the arrays of this map, in a directory named after the contents of the file and the radius
+        self.cacheDirectory = None
+        if cacheDirectory is not None:
+            key = hashlib.sha256(data).hexdigest() + "-r" + str(R)
+            self.cacheDirectory = os.path.join(cacheDirectory, key)
+
+        # Each cell is stored as the byte of its character
+        self.cells = self.loadCachedArray("cells")
+        if self.cells is None:
+            self.cells = parseGrid(data, start, H, W)
+            self.saveCachedArray("cells", self.cells)
+        # Rows of 'grid', decoded the first time it's used
+        self.gridRows = None
+
+        self.buildMasks()
+        # Coverage of every target cell in CSR format, built by 'precomputeCoverage': the cells covered by a router in
+        # validPositions[i] are coverageCells[coverageOffsets[i]:coverageOffsets[i + 1]] (flattened positions)
+        self.coverageOffsets = None
+        self.coverageCells = None
+
+    def buildMasks(self):
+        """
+        Builds the target, wall and void masks of the grid, and the structures derived from them.
+        """
+        self.targetMask = self.cells == TARGET
+        self.wallMask = self.cells == WALL
+        self.voidMask = self.cells == VOID
+
+        (targetX, targetY) = np.nonzero(self.targetMask)
+        self.validPositions = list(zip(targetX.tolist(), targetY.tolist()))
+        # Index of each target cell in 'validPositions' (-1 if it's not a target cell), which is its bit in coverage bitsets
+        self.targetIndex = np.full(self.targetMask.shape, -1, dtype=np.int32)
+        self.targetIndex[self.targetMask] = np.arange(len(targetX), dtype=np.int32)
+        self.targetCoveredCells = int(np.count_nonzero(self.targetMask))
+        self.wallPrefix = self.buildWallPrefix()
+
+    @property
+    def grid(self):
+        """
+        The grid as a list of rows of 1-char strings, decoded once. Only kept for printing; use the masks everywhere
+        else. The rows are shared, so copy a row before changing it.
+        """
+        if self.gridRows is None:
+            self.gridRows = [list(row.tobytes().decode("ascii")) for row in self.cells]
+        return self.gridRows
+
+    def buildWallPrefix(self):
+        """
+        Builds the summed-area table of the wall cells.
+        wallPrefix[i][j] is the number of walls in the rectangle of rows [0, i[ and columns [0, j[.
+        """
+        wallPrefix = np.zeros((self.height + 1, self.width + 1), dtype=np.int32)
+        np.cumsum(np.cumsum(self.wallMask, axis=0, dtype=np.int32), axis=1, out=wallPrefix[1:, 1:])
+        return wallPrefix
+
+    def wallsInRectangle(self, top, left, bottom, right):
+        """
+        Returns the number of wall cells in the rectangle of rows [top, bottom] and columns [left, right], in O(1).
+        Also works with numpy arrays of rectangles.
+        """
+        wallPrefix = self.wallPrefix
+        return wallPrefix[bottom + 1, right + 1] - wallPrefix[top, right + 1] - wallPrefix[bottom + 1, left] + wallPrefix[top, left]
 
     def getCellNeighbours(self, coord):
         """
@@ -97,57 +196,74 @@ class Blueprint:
 
     def atGrid(self, x, y=None):
         """
-        Returns the content of a position of the grid.
+        Returns the content of a position of the grid, or False if it's outside the grid.
         Accepts one parameter only when it's a tuple.
         """
-        try:
-            if type(x) == tuple or type(x) == list:
-                if 0 <= x[0] <= self.height and 0 <= x[1] <= self.width:
-                    return self.grid[x[0]][x[1]]
-                else:
-                    raise IndexError()
-            if 0 <= x <= self.height and 0 <= x <= self.width:
-                return self.grid[x][y]
-            else:
-                raise IndexError()
-        except IndexError:
-            return False
+        if y is None:
+            (x, y) = x
+        if 0 <= x < self.height and 0 <= y < self.width:
+            return chr(self.cells[x, y])
+        return False
 
     def validPosition(self, x, y=None):
         """
         Checks if a position is valid and doesn't have a wall.
         """
-        if x == (-1, -1) or x == -1 and y == -1:
+        if y is None:
+            (x, y) = x
+        if x == -1 and y == -1:
             return True
-        atGrid = self.atGrid(x, y)
-        if not atGrid:
-            return False
-        return atGrid != '#'
+        return 0 <= x < self.height and 0 <= y < self.width and not self.wallMask[x, y]
 
     def notVoid(self, x, y=None):
         """
         Checks if a position is valid and isn't a void.
         """
-        atGrid = self.atGrid(x, y)
-        if not atGrid:
-            return False
-        return atGrid != '-'
+        if y is None:
+            (x, y) = x
+        return 0 <= x < self.height and 0 <= y < self.width and not self.voidMask[x, y]
 
     def validPositionGenetic(self, x, y=None):
         """
         Checks if a position is valid and doesn't have a wall.
         """
-        atGrid = self.atGrid(x, y)
-        if not atGrid:
-            return False
-        return atGrid != '#'
+        if y is None:
+            (x, y) = x
+        return 0 <= x < self.height and 0 <= y < self.width and not self.wallMask[x, y]
 
     def reset(self):
         """
         Resets MST and cells coverage dictionaries.
         """
-        self.msts = {}
-        self.cellsCoverage = {}
+        self.msts.clear()
+        self.cellsCoverage.clear()
+        self.coverageIndices.clear()
+        self.coverageBits.clear()
+        self.fitness.clear()
+
+    def cacheStats(self):
+        """
+        Returns the counters of each cache.
+        """
+        return {"cellsCoverage": self.cellsCoverage.stats(), "coverageIndices": self.coverageIndices.stats(),
+                "coverageBits": self.coverageBits.stats(), "msts": self.msts.stats(),
+                "mstPaths": self.mstPaths.stats(), "fitness": self.fitness.stats()}
+
+    def resetCacheStats(self):
+        """
+        Resets the counters of each cache.
+        """
+        for cache in (self.cellsCoverage, self.coverageIndices, self.coverageBits, self.msts, self.mstPaths, self.fitness):
+            cache.resetStats()
+
+    def printCacheStats(self):
+        """
+        Prints the counters of each cache.
+        """
+        for (name, stats) in self.cacheStats().items():
+            print("Cache {}: {} entries ({:.1f} MB), {} hits, {} misses, {} evictions, hit rate {:.1%}".format(
+                name, stats["entries"], stats["bytes"] / 2 ** 20, stats["hits"], stats["misses"], stats["evictions"],
+                stats["hitRate"]))
 
     def printSolutionPaths(self, solution):
         """
@@ -211,58 +327,125 @@ class Blueprint:
         Returns a list of the cell coord that would be covered by the router's
         network if the router was to be put in a certain cell with coords.
         """
+        indices = self.getCellCoverageIndices(coords)
+        if indices is None:
+            return None
+        (coveredX, coveredY) = np.divmod(indices, self.width)
+        return list(zip(coveredX.tolist(), coveredY.tolist()))
+
+    @instrumented("getCellCoverage")
+    def getCellCoverageIndices(self, coords):
+        """
+        Same as 'getCellCoverage', but the cells are returned as a NumPy array of flattened positions (row * width + column),
+        in increasing order.
+        """
         if not self.validPosition(coords):
             return None
-        ret = []
+        if coords == (-1, -1):  # Router not placed
+            return np.empty(0, dtype=np.intp)
+        (a, b) = (coords[0], coords[1])  # Router coordinates
 
         # Coverage limits
-        upperCoverage = max(0, coords[0] - self.routerRadius)
-        leftCoverage = max(0, coords[1] - self.routerRadius)
-        rightCoverage = min(self.width, coords[1] + self.routerRadius)
-        bottomCoverage = min(self.height, coords[0] + self.routerRadius)
-
-        # getWalls
-        walls = []
-        for i in range(upperCoverage, bottomCoverage + 1):
-            for j in range(leftCoverage, rightCoverage + 1):
-                if self.atGrid((i, j)) == "#":
-                    walls.append((i, j))
-
-        # min e max [w, v]
-        for x in range(upperCoverage, bottomCoverage + 1):
-            for y in range(leftCoverage, rightCoverage + 1):
-                if self.atGrid((x, y)) == ".":
-                    (a, b) = (coords[0], coords[1])  # Router coordinates
-                    # (x, y): Cell coordinates
-
-                    minX = min(a, x)
-                    maxX = max(a, x)
-                    minY = min(b, y)
-                    maxY = max(b, y)
-
-                    # There is no wall cell inside the smallest enclosing rectangle of [a, b] and [x, y].
-                    # That is, there is no wall cells [w, v] where both:
-                    # min(a, x) <= w <= max(a, x)
-                    # min(b, y) <= v <= max(b, y)
-                    append = True
-                    for (wallX, wallY) in walls:
-                        if (maxX >= wallX >= minX) and (maxY >= wallY >= minY):
-                            # If 1 wall satisfies the condition, then the cell can't have coverage.
-                            # If no wall satisfies the condition, then the cell have coverage.
-                            append = False
-                    if append:
-                        ret.append((x, y))
-        return ret
+        upperCoverage = max(0, a - self.routerRadius)
+        leftCoverage = max(0, b - self.routerRadius)
+        rightCoverage = min(self.width - 1, b + self.routerRadius)
+        bottomCoverage = min(self.height - 1, a + self.routerRadius)
+
+        # (x, y): Cell coordinates, for every cell of the coverage window at once
+        x = np.arange(upperCoverage, bottomCoverage + 1)[:, None]
+        y = np.arange(leftCoverage, rightCoverage + 1)[None, :]
+
+        # There is no wall cell inside the smallest enclosing rectangle of [a, b] and [x, y].
+        # The walls inside that rectangle are counted with the wall prefix sums.
+        walls = self.wallsInRectangle(np.minimum(a, x), np.minimum(b, y), np.maximum(a, x), np.maximum(b, y))
+        covered = self.targetMask[upperCoverage:bottomCoverage + 1, leftCoverage:rightCoverage + 1] & (walls == 0)
+
+        coveredX, coveredY = np.nonzero(covered)
+        return (coveredX + upperCoverage) * self.width + (coveredY + leftCoverage)
 
     def getAllCellsCoverage(self):
         """
         Gets the router's network coverage for all cells.
         """
-        for x in range(self.width):
-            for y in range(self.height):
+        for x in range(self.height):
+            for y in range(self.width):
                 cellsCovered = self.getCellCoverage((x, y))
                 self.cellsCoverage[(x, y)] = cellsCovered
 
+    def precomputeCoverage(self, workers=1):
+        """
+        Computes the coverage of every target cell, split in chunks of 'validPositions' among a pool of processes,
+        and stores it in CSR format ('coverageOffsets' and 'coverageCells'). Then, coverage lookups don't compute anything.
+        If the blueprint has an on-disk cache, the arrays are loaded from it (or saved to it, the first time).
+        """
+        offsets = self.loadCachedArray("coverageOffsets")
+        cells = self.loadCachedArray("coverageCells")
+        if offsets is not None and cells is not None:
+            (self.coverageOffsets, self.coverageCells) = (offsets, cells)
+            return
+
+        chunks = [(start, min(start + COVERAGE_CHUNK, len(self.validPositions)))
+                  for start in range(0, len(self.validPositions), COVERAGE_CHUNK)]
+        if workers > 1 and len(chunks) > 1:
+            with multiprocessing.Pool(workers, initializer=parallel.initWorker, initargs=(self,)) as pool:
+                results = pool.map(parallel.coverageChunk, chunks)
+        else:
+            results = [self.getChunkCoverage(start, end) for (start, end) in chunks]
+
+        counts = np.concatenate([np.zeros(1, dtype=np.int64)] + [counts for (counts, _) in results])
+        self.coverageOffsets = np.cumsum(counts)
+        self.coverageCells = np.concatenate([np.empty(0, dtype=np.int32)] + [cells for (_, cells) in results])
+        self.saveCachedArray("coverageCells", self.coverageCells)
+        self.saveCachedArray("coverageOffsets", self.coverageOffsets)
+
+    def loadCachedArray(self, name):
+        """
+        Loads an array from the on-disk cache, memory-mapped (read-only).
+        Returns None if there's no cache or the array isn't in it.
+        """
+        if self.cacheDirectory is None:
+            return None
+        path = os.path.join(self.cacheDirectory, name + ".npy")
+        if not os.path.exists(path):
+            return None
+        return np.load(path, mmap_mode="r")
+
+    def saveCachedArray(self, name, array):
+        """
+        Saves an array to the on-disk cache, if there's one. The file is written with a temporary name and then renamed,
+        so other processes never see it incomplete.
+        """
+        if self.cacheDirectory is None:
+            return
+        os.makedirs(self.cacheDirectory, exist_ok=True)
+        path = os.path.join(self.cacheDirectory, name + ".npy")
+        temporary = path + "." + str(os.getpid()) + ".tmp"
+        with open(temporary, "wb") as file:
+            np.save(file, array)
+        os.replace(temporary, path)
+
+    def getChunkCoverage(self, start, end):
+        """
+        Computes the coverage of validPositions[start:end].
+        :return: Tuple (number of cells covered by each position, covered cells of all positions, concatenated)
+        """
+        coverage = [self.getCellCoverageIndices(self.validPositions[i]) for i in range(start, end)]
+        counts = np.array([len(cells) for cells in coverage], dtype=np.int64)
+        cells = np.concatenate(coverage).astype(np.int32) if coverage else np.empty(0, dtype=np.int32)
+        return counts, cells
+
+    def precomputedCoverage(self, router):
+        """
+        Returns the covered cells by one router from the precomputed CSR arrays (flattened positions),
+        or None if they weren't precomputed for that position.
+        """
+        if self.coverageOffsets is None or router == (-1, -1) or not self.atGrid(router):
+            return None
+        i = self.targetIndex[router]
+        if i < 0:
+            return None
+        return self.coverageCells[self.coverageOffsets[i]:self.coverageOffsets[i + 1]]
+
     def getSolutionCoveredCells(self, solution):
         """
         Returns a list of cells covered by all routers in a solution.
@@ -275,6 +458,34 @@ class Blueprint:
         cells = list(dict.fromkeys(cells))
         return cells
 
+    def getSolutionCoverageBits(self, solution):
+        """
+        Returns the bitset of the cells covered by all routers in a solution.
+        Bit i is set if the cell validPositions[i] is covered.
+        """
+        coverage = 0
+        for router in solution:
+            if router != (-1, -1):
+                (lowestBit, bits) = self.accessCoverageBitsDict(router)
+                coverage |= bits << lowestBit
+        return coverage
+
+    def getSolutionCoveredCellsCount(self, solution):
+        """
+        Returns the number of cells covered by all routers in a solution.
+        """
+        return popcount(self.getSolutionCoverageBits(solution))
+
+    def marginalGain(self, coverage, router):
+        """
+        Returns the number of cells covered by 'router' that are not in the bitset 'coverage' yet.
+        """
+        if router == (-1, -1):
+            return 0
+        (lowestBit, bits) = self.accessCoverageBitsDict(router)
+        return popcount(bits & ~(coverage >> lowestBit))
+
+    @instrumented("accessCoverageDict")
     def accessCoverageDict(self, router):
         """
         Access or computes the covered cells by one router.
@@ -283,33 +494,81 @@ class Blueprint:
             coverage = self.cellsCoverage[router]
             return coverage
         except KeyError:
-            coverage = self.getCellCoverage(router)
+            indices = self.precomputedCoverage(router)
+            if indices is not None:
+                (coveredX, coveredY) = np.divmod(indices, self.width)
+                coverage = list(zip(coveredX.tolist(), coveredY.tolist()))
+            else:
+                coverage = self.getCellCoverage(router)
             self.cellsCoverage[router] = coverage
             return coverage
 
+    @instrumented("accessCoverageIndicesDict")
+    def accessCoverageIndicesDict(self, router):
+        """
+        Access or computes the covered cells by one router, as a NumPy array of flattened positions (row * width + column).
+        Precomputed coverage is read directly, without caching.
+        """
+        indices = self.precomputedCoverage(router)
+        if indices is not None:
+            return indices
+        try:
+            indices = self.coverageIndices[router]
+            return indices
+        except KeyError:
+            indices = self.getCellCoverageIndices(router)
+            self.coverageIndices[router] = indices
+            return indices
+
+    @instrumented("accessCoverageBitsDict")
+    def accessCoverageBitsDict(self, router):
+        """
+        Access or computes the covered cells by one router, as a bitset over the indices of 'validPositions'.
+        The bitset is stored shifted to its lowest bit, so it only takes the size of the coverage window.
+        :return: Tuple (lowest bit, shifted bitset)
+        """
+        try:
+            coverage = self.coverageBits[router]
+            return coverage
+        except KeyError:
+            indices = self.targetIndex.ravel()[self.accessCoverageIndicesDict(router)]
+            if len(indices) == 0:
+                coverage = (0, 0)
+            else:
+                # The indices are in increasing order
+                lowestBit = int(indices[0])
+                bits = np.zeros(int(indices[-1]) - lowestBit + 1, dtype=bool)
+                bits[indices - lowestBit] = True
+                coverage = (lowestBit, int.from_bytes(np.packbits(bits, bitorder="little").tobytes(), "little"))
+            self.coverageBits[router] = coverage
+            return coverage
+
+    @instrumented("accessMstDict")
     def accessMstDict(self, solution):
         """
         Access or computes the minimum spanning tree of a graph, whose nodes are the routers of a solution plus the backbone position.
+        Its weight is the number of cells connected to the backbone.
         """
         try:
             mst = self.msts[tuple(solution)]
             return mst
         except KeyError:
-            graph = kruskal.buildGraphWithSolution(solution, self.backbonePosition)
-            mst = graph.kruskal()
+            mst = Backbone(self, solution)
             self.msts[tuple(solution)] = mst
             return mst
 
+    @instrumented("accessMstPathsDict")
     def accessMstPathsDict(self, solution):
         """
-        Access or create the backbone cells path for a given solution.
+        Access or create the backbone cells path for a given solution. Only needed to show a solution.
+        Each cell is only listed once, and the initial backbone cell is not listed.
         """
         try:
             paths = self.mstPaths[tuple(solution)]
             return paths
         except KeyError:
             mst = self.accessMstDict(solution)
-            paths = mst.getPaths(self)
+            paths = mst.cells()
             self.mstPaths[tuple(solution)] = paths
             return paths
 
@@ -323,9 +582,9 @@ class Blueprint:
         gridStr = '\n'.join(rowsInStr)
         print(gridStr)
 
-    def plotSolution(self, solution, fpath=None):  # https://github.com/sbrodehl/HashCode/blob/master/Final%20Round/Utilities.py#L90
+    def plotSolution(self, solution, fpath=None, show=True):  # https://github.com/sbrodehl/HashCode/blob/master/Final%20Round/Utilities.py#L90
         """
-        Coverage plot.
+        Coverage plot. If 'show' is False, the figure is only saved (to 'fpath') and closed.
         """
 
         # Plot colors
@@ -344,19 +603,12 @@ class Blueprint:
         ax.set_axis_off()
         fig.add_axes(ax)
 
-        gridAux = []  # Colors grid
+        gridAux = np.zeros((self.height, self.width, 3), dtype=np.uint8)  # Colors grid
 
         # Colors void cells, target cells and wall cells
-        for row in self.grid:
-            rowAux = []
-            for element in row:
-                if element == '-':
-                    rowAux.append(purple)
-                if element == '.':
-                    rowAux.append(uncoloredBlue)
-                if element == '#':
-                    rowAux.append(darkBlue)
-            gridAux.append(rowAux)
+        gridAux[self.voidMask] = purple
+        gridAux[self.targetMask] = uncoloredBlue
+        gridAux[self.wallMask] = darkBlue
 
         # Colors covered cells
         for router in solution:
@@ -369,7 +621,7 @@ class Blueprint:
         # Colors paths
         paths = self.accessMstPathsDict(solution)
         for cell in paths:
-            if gridAux[cell[0]][cell[1]] == darkBlue:
+            if self.wallMask[cell]:
                 # If path cell coincides with a wall cell, make it darker
                 setGridContent(gridAux, darkYellow, cell)
             else:
@@ -389,4 +641,7 @@ class Blueprint:
         if fpath is not None:
             plt.savefig(fpath)
 
-        plt.show()
+        if show:
+            plt.show()
+        else:
+            plt.close(fig)
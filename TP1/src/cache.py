@@ -0,0 +1,102 @@
+from collections import OrderedDict
+import sys
+
+
+def approximateSize(obj, depth=3):
+    """
+    Estimates the memory used by an object, in bytes.
+    Containers are measured by their first element times their length, so the cost doesn't grow with their size.
+    Objects are measured by their attributes.
+    """
+    size = sys.getsizeof(obj)
+    if depth == 0:
+        return size
+    if isinstance(obj, dict):
+        if obj:
+            (key, value) = next(iter(obj.items()))
+            size += len(obj) * (approximateSize(key, depth - 1) + approximateSize(value, depth - 1))
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        if obj:
+            size += len(obj) * approximateSize(next(iter(obj)), depth - 1)
+    elif hasattr(obj, "__dict__"):  # Attributes are not alike, so all of them are measured
+        size += sum(approximateSize(value, depth - 1) for value in vars(obj).values())
+    return size
+
+
+class LRUCache:
+    """
+    Dictionary with a bounded size. When it's full, the least recently used entries are evicted.
+    The size can be bounded by the number of entries and/or by an estimate of the memory used (in bytes).
+    Accessing a missing key raises KeyError, just like a dictionary, so it can replace one.
+    """
+    def __init__(self, maxBytes=None, maxEntries=None):
+        self.maxBytes = maxBytes
+        self.maxEntries = maxEntries
+        self.entries = OrderedDict()  # key -> (value, size)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __getitem__(self, key):
+        try:
+            (value, _) = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            raise
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key, value):
+        if key in self.entries:
+            self.bytes -= self.entries.pop(key)[1]
+        size = approximateSize(key) + approximateSize(value)
+        self.entries[key] = (value, size)
+        self.bytes += size
+        self.evict()
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache is within its bounds.
+        """
+        while self.entries and ((self.maxEntries is not None and len(self.entries) > self.maxEntries) or
+                                (self.maxBytes is not None and self.bytes > self.maxBytes)):
+            (_, (_, size)) = self.entries.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+
+    def clear(self):
+        """
+        Removes every entry. The counters are kept.
+        """
+        self.entries.clear()
+        self.bytes = 0
+
+    def resetStats(self):
+        """
+        Resets the counters. The entries are kept.
+        """
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def hitRate(self):
+        """
+        Fraction of the accesses that found the key.
+        """
+        accesses = self.hits + self.misses
+        return self.hits / accesses if accesses else 0
+
+    def stats(self):
+        """
+        :return: Dictionary with the cache counters.
+        """
+        return {"entries": len(self.entries), "bytes": self.bytes, "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "hitRate": self.hitRate()}
@@ -0,0 +1,151 @@
+"""
+Cooling schedules of simulated annealing. A schedule gives the temperature of the next move and is told the delta of
+each move and whether it was accepted, so the adaptive schedules can follow the acceptance rate instead of spending
+the same number of moves at every temperature.
+"""
+import math
+from utils import randomMove
+
+# Temperature used when it can't be estimated (the one of the original schedule)
+INITIAL_TEMPERATURE = 10000
+# Moves of the original schedule (10000 to 10, factor of 0.99, 10 moves per temperature). It's the length of the
+# adaptive schedules when the run has no budget.
+DEFAULT_MOVES = 10 * math.ceil(math.log(10 / 10000) / math.log(0.99))
+
+
+def estimateInitialTemperature(evaluator, samples=100, acceptance=0.8):
+    """
+    Estimates the temperature at which a worse neighbour of the evaluator's solution is accepted with probability
+    'acceptance' on average: mean(worse deltas) / ln(acceptance), from 'samples' random moves.
+    :return: The temperature, or None if no sampled move was worse
+    """
+    worse = []
+    for _ in range(samples):
+        routerIndex, newPosition = randomMove(evaluator.solution)
+        neighbourValue = evaluator.evaluateMove(routerIndex, newPosition)
+        if neighbourValue is not None and neighbourValue < evaluator.value:
+            worse.append(neighbourValue - evaluator.value)
+    if not worse:
+        return None
+    return sum(worse) / len(worse) / math.log(acceptance)
+
+
+class Schedule:
+    """
+    Base of the schedules. 'progress' is the fraction of the run done, from 0 to 1.
+    """
+    def __init__(self, initialTemp):
+        self.initialTemp = initialTemp
+        self.temperature = initialTemp
+
+    def update(self, delta, accepted, progress):
+        """
+        Called after each move, with its delta (neighbour value - current value) and whether it was accepted.
+        """
+        pass
+
+    def frozen(self, progress):
+        """
+        Checks if the run must stop.
+        """
+        return progress >= 1
+
+    def reheat(self, temperature):
+        """
+        Raises the temperature to 'temperature', if it's lower.
+        """
+        self.temperature = max(self.temperature, temperature)
+
+
+class GeometricSchedule(Schedule):
+    """
+    The original schedule: 'movesPerTemp' moves per temperature, then the temperature is multiplied by 'alpha', until
+    it reaches 'finalTemp' (by default, 1/1000 of the initial temperature, like 10000 to 10).
+    """
+    def __init__(self, initialTemp, finalTemp=None, alpha=0.99, movesPerTemp=10):
+        super().__init__(initialTemp)
+        self.finalTemp = initialTemp / 1000 if finalTemp is None else finalTemp
+        self.alpha = alpha
+        self.movesPerTemp = movesPerTemp
+        self.level = 0
+        self.moves = 0
+
+    def update(self, delta, accepted, progress):
+        self.moves += 1
+        if self.moves % self.movesPerTemp == 0:
+            self.level += 1
+            self.temperature = self.initialTemp * self.alpha ** self.level
+
+    def frozen(self, progress):
+        return self.temperature <= self.finalTemp
+
+    def reheat(self, temperature):
+        if temperature > self.temperature:
+            # The schedule goes back to the level of that temperature
+            self.level = max(0, math.floor(math.log(temperature / self.initialTemp) / math.log(self.alpha)))
+            self.temperature = self.initialTemp * self.alpha ** self.level
+
+
+class AcceptanceSchedule(Schedule):
+    """
+    Acceptance-ratio-targeted cooling: every 'movesPerTemp' moves, the ratio of worse neighbours accepted is compared
+    with a target, which falls geometrically from 'initialRatio' to 'finalRatio' along the run. The temperature is
+    multiplied by 'alpha' if more were accepted than the target, and divided by it otherwise.
+    """
+    def __init__(self, initialTemp, alpha=0.9, movesPerTemp=50, initialRatio=0.5, finalRatio=0.001):
+        super().__init__(initialTemp)
+        self.alpha = alpha
+        self.movesPerTemp = movesPerTemp
+        self.initialRatio = initialRatio
+        self.finalRatio = finalRatio
+        self.moves = 0
+        self.worse = 0
+        self.acceptedWorse = 0
+
+    def update(self, delta, accepted, progress):
+        self.moves += 1
+        if delta < 0:
+            self.worse += 1
+            self.acceptedWorse += accepted
+        if self.moves % self.movesPerTemp == 0 and self.worse > 0:
+            target = self.initialRatio * (self.finalRatio / self.initialRatio) ** min(1, progress)
+            if self.acceptedWorse / self.worse > target:
+                self.temperature *= self.alpha
+            else:
+                self.temperature /= self.alpha
+            self.worse = 0
+            self.acceptedWorse = 0
+
+
+class LamSchedule(Schedule):
+    """
+    Modified Lam schedule: the acceptance rate (a moving average of the moves accepted) is steered towards a target
+    that falls from 1 to 0.44 in the first 15% of the run, stays at 0.44 until 65%, and then falls towards 0.
+    After each move the temperature is multiplied by 'factor' if the rate is above the target, and divided by it
+    otherwise.
+    """
+    def __init__(self, initialTemp, factor=0.999):
+        super().__init__(initialTemp)
+        self.factor = factor
+        self.rate = 0.5
+
+    def update(self, delta, accepted, progress):
+        self.rate = (499 * self.rate + accepted) / 500
+        if progress < 0.15:
+            target = 0.44 + 0.56 * 560 ** (-progress / 0.15)
+        elif progress < 0.65:
+            target = 0.44
+        else:
+            target = 0.44 * 440 ** (-(progress - 0.65) / 0.35)
+        if self.rate > target:
+            self.temperature *= self.factor
+        else:
+            self.temperature /= self.factor
+
+
+# Schedules by name, built with the initial temperature
+SCHEDULES = {
+    "geometric": GeometricSchedule,
+    "acceptance": AcceptanceSchedule,
+    "lam": LamSchedule,
+}
@@ -0,0 +1,172 @@
+import numpy as np
+from backbone import Backbone
+from gainMap import GainMap
+from instrumentation import instrumented
+from utils import *
+
+
+class IncrementalEvaluator:
+    """
+    Keeps the state of a solution (how many routers cover each cell and the backbone tree), so that the value of a
+    solution which differs from it in a single router is computed by delta:
+        - only the cells entering or leaving coverage are counted;
+        - only the backbone tree edges affected by the router are changed.
+    A move puts the router at index 'routerIndex' in 'newPosition'. If 'newPosition' is (-1, -1), the router is
+    removed like in 'utils.neighbour': the last router of the solution takes its place.
+    """
+    def __init__(self, blueprint, solution):
+        self.blueprint = blueprint
+        self.solution = solution.copy()
+
+        # Number of routers covering each cell, indexed by the flattened cell position
+        self.coverageCount = np.zeros(blueprint.height * blueprint.width, dtype=np.int32)
+        # Number of routers in each position, to find duplicates
+        self.positions = {}
+        for router in self.solution:
+            if router == (-1, -1):
+                continue
+            self.positions[router] = self.positions.get(router, 0) + 1
+            cells = self.coverageIndices(router)
+            self.coverageCount[cells] += 1
+        self.coveredCells = int(np.count_nonzero(self.coverageCount))
+        self.numRouters = routersPlaced(self.solution)
+
+        self.backbone = Backbone(blueprint, self.solution)
+        self.value = self.computeValue(self.coveredCells, self.backbone.weight, self.numRouters)
+        # Coverage gain of every position (see 'trackGains')
+        self.gainMap = None
+
+    def trackGains(self):
+        """
+        Keeps a GainMap of the current solution, updated by each move made.
+        :return: The GainMap
+        """
+        if self.gainMap is None:
+            self.gainMap = GainMap(self.blueprint, self.coverageCount)
+        return self.gainMap
+
+    def coverageIndices(self, router):
+        """
+        Returns the flattened positions of the cells covered by a router.
+        """
+        return self.blueprint.accessCoverageIndicesDict(router)
+
+    @instrumented("backboneDelta")
+    def backboneCells(self, oldPosition, newPosition):
+        """
+        Returns the number of backbone cells after moving the router in 'oldPosition' to 'newPosition'.
+        The backbone is left as it was.
+        """
+        self.backbone.checkpoint()
+        self.backbone.moveTerminal(oldPosition, newPosition)
+        backboneCells = self.backbone.weight
+        self.backbone.rollback()
+        return backboneCells
+
+    def computeValue(self, coveredCells, backboneCells, routers):
+        """
+        Same formula as 'utils.value'. Returns None if the budget is exceeded.
+        """
+        blueprint = self.blueprint
+        remainingBudget = blueprint.budget - (backboneCells * blueprint.backboneCost + routers * blueprint.routerCost)
+        if remainingBudget < 0:
+            return None
+        return 1000 * coveredCells + remainingBudget
+
+    def remainingBudget(self):
+        """
+        Remaining budget of the current solution.
+        """
+        blueprint = self.blueprint
+        return blueprint.budget - (self.backbone.weight * blueprint.backboneCost + self.numRouters * blueprint.routerCost)
+
+    def candidate(self, routerIndex, newPosition):
+        """
+        Returns the solution obtained by the move, or None if the move is not valid.
+        """
+        oldPosition = self.solution[routerIndex]
+        if oldPosition == newPosition:
+            return None
+        candidate = self.solution.copy()
+        if newPosition == (-1, -1):
+            lastIx = getIndexOfLastNonEmptyRouter(candidate)
+            if lastIx is None or routerIndex > lastIx:  # There's no router to remove
+                return None
+            candidate[routerIndex] = candidate[lastIx]
+            candidate[lastIx] = (-1, -1)
+        else:
+            # The new position can't have a wall or another router
+            if not self.blueprint.validPosition(newPosition) or newPosition in self.positions:
+                return None
+            candidate[routerIndex] = newPosition
+        return candidate
+
+    @instrumented("coverageDelta")
+    def coverageDelta(self, oldPosition, newPosition, keep=False):
+        """
+        Returns the number of covered cells after replacing the router in 'oldPosition' by one in 'newPosition'.
+        Only the cells covered by these 2 routers are visited. The coverage counts are updated only if 'keep' is True.
+        """
+        count = self.coverageCount
+        oldCells = self.coverageIndices(oldPosition) if oldPosition != (-1, -1) else None
+        newCells = self.coverageIndices(newPosition) if newPosition != (-1, -1) else None
+
+        lost, gained = 0, 0
+        if oldCells is not None:
+            count[oldCells] -= 1
+            lost = np.count_nonzero(count[oldCells] == 0)
+        if newCells is not None:
+            count[newCells] += 1
+            gained = np.count_nonzero(count[newCells] == 1)
+
+        if not keep:
+            if newCells is not None:
+                count[newCells] -= 1
+            if oldCells is not None:
+                count[oldCells] += 1
+        return self.coveredCells - lost + gained
+
+    @instrumented("evaluateMove")
+    def evaluateMove(self, routerIndex, newPosition):
+        """
+        Returns the value of the solution obtained by the move, without changing the current solution.
+        Returns None if the move is not valid or exceeds the budget.
+        """
+        self.blueprint.evaluations += 1
+        candidate = self.candidate(routerIndex, newPosition)
+        if candidate is None:
+            return None
+        oldPosition = self.solution[routerIndex]
+        coveredCells = self.coverageDelta(oldPosition, newPosition)
+        routers = self.numRouters - (oldPosition != (-1, -1)) + (newPosition != (-1, -1))
+        return self.computeValue(coveredCells, self.backboneCells(oldPosition, newPosition), routers)
+
+    @instrumented("applyMove")
+    def applyMove(self, routerIndex, newPosition):
+        """
+        Makes the move in the current solution.
+        :return: The new value of the current solution (None if it exceeds the budget), or False if the move is not valid.
+        """
+        candidate = self.candidate(routerIndex, newPosition)
+        if candidate is None:
+            return False
+        oldPosition = self.solution[routerIndex]
+        self.coveredCells = self.coverageDelta(oldPosition, newPosition, True)
+        if self.gainMap is not None:
+            self.gainMap.update(self.coverageIndices(oldPosition) if oldPosition != (-1, -1) else None,
+                                self.coverageIndices(newPosition) if newPosition != (-1, -1) else None,
+                                self.coverageCount)
+
+        if oldPosition != (-1, -1):
+            self.positions[oldPosition] -= 1
+            if self.positions[oldPosition] == 0:
+                del self.positions[oldPosition]
+            self.numRouters -= 1
+        if newPosition != (-1, -1):
+            self.positions[newPosition] = self.positions.get(newPosition, 0) + 1
+            self.numRouters += 1
+
+        self.solution = candidate
+        self.backbone.moveTerminal(oldPosition, newPosition)
+        self.value = self.computeValue(self.coveredCells, self.backbone.weight, self.numRouters)
+        return self.value
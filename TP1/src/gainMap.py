@@ -0,0 +1,66 @@
+import numpy as np
+
+# Positions whose gain is computed at once
+GAIN_CHUNK = 4096
+
+
+class GainMap:
+    """
+    Coverage gain of every valid position: how many target cells not covered yet a router there would cover, walls
+    included. It's computed for all positions at once from the precomputed coverage (see
+    'Blueprint.precomputeCoverage'), and then updated only where the coverage changes.
+    Coverage is symmetric (a router in cell a covers cell b if and only if one in b covers a, since both are targets and
+    the rectangle between them is the same), so the positions whose gain changes with a cell are the cells it covers.
+    """
+    def __init__(self, blueprint, coverageCount):
+        """
+        :param coverageCount: Number of routers covering each cell, indexed by the flattened cell position
+        """
+        if blueprint.coverageOffsets is None:
+            blueprint.precomputeCoverage()
+        self.blueprint = blueprint
+        self.targetIndex = blueprint.targetIndex.ravel()
+        uncovered = (blueprint.targetMask.ravel() & (coverageCount == 0)).astype(np.int32)
+
+        # Sum of the uncovered cells of each position, a chunk of positions at a time to bound the memory used
+        offsets = blueprint.coverageOffsets
+        positions = len(blueprint.validPositions)
+        self.gains = np.zeros(positions, dtype=np.int32)
+        for start in range(0, positions, GAIN_CHUNK):
+            end = min(start + GAIN_CHUNK, positions)
+            cells = blueprint.coverageCells[offsets[start]:offsets[end]]
+            # Every position covers at least its own cell, so no segment is empty
+            self.gains[start:end] = np.add.reduceat(uncovered[cells], offsets[start:end] - offsets[start])
+
+    def positionsCovering(self, cells):
+        """
+        Returns the indices (in 'validPositions') of the positions covering each cell, concatenated.
+        """
+        offsets = self.blueprint.coverageOffsets
+        coverageCells = self.blueprint.coverageCells
+        coverage = [coverageCells[offsets[i]:offsets[i + 1]] for i in self.targetIndex[cells].tolist()]
+        if not coverage:
+            return np.empty(0, dtype=np.int32)
+        return self.targetIndex[np.concatenate(coverage)]
+
+    def update(self, oldCells, newCells, coverageCount):
+        """
+        Updates the gains after a router covering 'oldCells' was replaced by one covering 'newCells' (flattened cell
+        positions, None if there's no router). 'coverageCount' must already be updated.
+        """
+        empty = np.empty(0, dtype=np.intp)
+        oldCells = empty if oldCells is None else oldCells
+        newCells = empty if newCells is None else newCells
+        lost = np.setdiff1d(oldCells, newCells, assume_unique=True)
+        lost = lost[coverageCount[lost] == 0]
+        gained = np.setdiff1d(newCells, oldCells, assume_unique=True)
+        gained = gained[coverageCount[gained] == 1]
+        np.add.at(self.gains, self.positionsCovering(lost), 1)
+        np.subtract.at(self.gains, self.positionsCovering(gained), 1)
+
+    def bestPosition(self):
+        """
+        Returns the position with the highest gain and its gain.
+        """
+        i = int(np.argmax(self.gains))
+        return self.blueprint.validPositions[i], int(self.gains[i])
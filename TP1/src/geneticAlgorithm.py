@@ -1,7 +1,11 @@
+import os
 import random
 import time
+import multiprocessing
 import blueprint as bp
+import parallel
 from utils import *
+from anytime import Budget, BestSoFar, Step, run
 
 
 def crossover(sol1, sol2):
@@ -34,36 +38,51 @@ def mutation(blueprint, sol):
     for i in range(routersToMutate):
         if r == 0:
             break
-        sol = randomNeighbour(blueprint, sol, True)[0]
+        neighbourSol = randomNeighbour(blueprint, sol, True)[0]
+        if neighbourSol is None:  # Invalid neighbour (the child of a crossover can have duplicate routers)
+            break
+        sol = neighbourSol
         r -= 1
 
     return sol
 
 
-def generateInitialPopulation(blueprint):
+def drawUnusedPosition(blueprint, positionsAdded, budget=None):
+    """
+    Draws a random valid position not used yet by the population.
+    :return: Its index in 'validPositions', or None if all of them are used or the budget ran out.
+    """
+    while len(positionsAdded) < len(blueprint.validPositions):
+        if budget is not None and budget.exhausted():
+            return None
+        rand = random.randint(0, len(blueprint.validPositions) - 1)
+        if rand not in positionsAdded:
+            return rand
+    return None
+
+
+def generateInitialPopulation(blueprint, populationSize=10, budget=None):
     """
     Generates the first generation of solutions randomly.
+    If the budget (see 'anytime.Budget') runs out, the population is smaller (but has at least 1 solution).
     :return: list with population of first generation.
     """
     population = []
     positionsAdded = {}
     iteration = 0
-    lastIteration = 10
+    lastIteration = populationSize
 
-    while iteration < lastIteration:
-        print("Generating initial population: " + str(iteration) + "/" + str(lastIteration))
+    while iteration < lastIteration and not (population and budget is not None and budget.exhausted()):
         individualSol = []
 
         # Generating each solution
+        stopped = False
         for j in range(blueprint.getMaxRouters()):
-            rand = random.randint(0, len(blueprint.validPositions) - 1)
-            while True:
-                try:
-                    positionsAdded[rand]
-                except KeyError:
-                    break
-                rand = random.randint(0, len(blueprint.validPositions) - 1)
-                continue
+            # The first solution is always completed, so the population isn't empty
+            rand = drawUnusedPosition(blueprint, positionsAdded, budget if population else None)
+            if rand is None:
+                stopped = True
+                break
 
             individualSol.append(blueprint.validPositions[rand])
             positionsAdded[rand] = True
@@ -71,20 +90,18 @@ def generateInitialPopulation(blueprint):
             # Check if last router added covered any cell (if it doesn't, it's not needed)
             while len(blueprint.accessCoverageDict(individualSol[-1])) == 0:
                 individualSol.pop()
-                rand = random.randint(0, len(blueprint.validPositions) - 1)
-                while True:
-                    try:
-                        positionsAdded[rand]
-                    except KeyError:
-                        break
-                    rand = random.randint(0, len(blueprint.validPositions) - 1)
-                    continue
-
+                rand = drawUnusedPosition(blueprint, positionsAdded, budget if population else None)
+                if rand is None:
+                    stopped = True
+                    break
+                positionsAdded[rand] = True
                 individualSol.append(blueprint.validPositions[rand])
+            if stopped:
+                break
 
             # Check if the actual routers cover all target covered cells
             # If so, fill the remaining solution list with (-1, -1)
-            if blueprint.targetCoveredCells == len(blueprint.getSolutionCoveredCells(individualSol)):
+            if blueprint.targetCoveredCells == blueprint.getSolutionCoveredCellsCount(individualSol):
                 while len(individualSol) < blueprint.getMaxRouters():
                     individualSol.append((-1, -1))
                 break
@@ -97,27 +114,50 @@ def generateInitialPopulation(blueprint):
                     individualSol.append((-1, -1))
                 break
 
+        # No positions (or time) left: the solution keeps the routers added so far, unless it has none
+        if stopped:
+            if population and not individualSol:
+                break
+            while len(individualSol) < blueprint.getMaxRouters():
+                individualSol.append((-1, -1))
+
         iteration += 1
         population.append(individualSol)
+        if stopped:
+            break
+
+    population = sortPopulation(blueprint, population)
+    return population
 
-    population.sort(reverse=True, key=lambda elem: value(blueprint, elem))
 
-    print("Generating initial population: Done!")
+def sortPopulation(blueprint, population):
+    """
+    Orders a population by value, the best solution first. The values are computed in a single batch.
+    Solutions with the same value keep their order.
+    """
+    fitness = evaluatePopulation(blueprint, population)
+    order = sorted(range(len(population)), reverse=True, key=lambda i: fitness[i])
+    return [population[i] for i in order]
+
+
+def evolve(blueprint, population, generations, budget=None):
+    """
+    For some "generations", all population reproduces randomly, between the best half of solutions.
+    Stops earlier if the budget (see 'anytime.Budget') runs out.
+    :return: The last generation, ordered by value.
+    """
+    for population in evolveGenerations(blueprint, population, generations, budget):
+        pass
     return population
 
 
-def geneticAlgorithm(blueprint):
+def evolveGenerations(blueprint, population, generations, budget=None):
     """
-    Genetic Algorithm: For 20 "generations", all population reproduces randomly, between the best half of solutions.
-    :return: The best solution of the last generation.
+    Generator version of 'evolve': yields each generation, ordered by value.
     """
-    population = generateInitialPopulation(blueprint)
     iteration = 0
-    lastIteration = 20
-
-    while iteration < lastIteration:
-        print("Generation... " + str(iteration) + "/" + str(lastIteration))
 
+    while iteration < generations and not (budget is not None and budget.exhausted()):
         nextGeneration = []
 
         for i in range(int(len(population))):
@@ -129,15 +169,173 @@ def geneticAlgorithm(blueprint):
             if random.randint(0, 100) < 10:  # 10% chance of a child to be mutated
                 child = mutation(blueprint, child)
 
-            if value(blueprint, child) is not None:
-                nextGeneration.append(child)
+            nextGeneration.append(child)
 
-        population = nextGeneration
-        population.sort(reverse=True, key=lambda elem: value(blueprint, elem))
+        # Children that exceed the budget are discarded. If no child is within the budget, the parents stay
+        fitness = evaluatePopulation(blueprint, nextGeneration)
+        nextGeneration = [child for (i, child) in enumerate(nextGeneration) if fitness[i] != -inf]
+        if nextGeneration:
+            population = sortPopulation(blueprint, nextGeneration)
         iteration += 1
+        yield population
 
-    print("Generation... Done!")
-    print("Solution value: " + str(value(blueprint, population[0])))
 
+def geneticAlgorithm(blueprint, populationSize=10, generations=20, timeLimit=None, maxEvaluations=None, callback=None):
+    """
+    Genetic Algorithm (see 'geneticAlgorithmSteps'), run until it ends.
+    Reports each improvement to 'callback(solution, value)'.
+    :return: The best solution of all generations.
+    """
+    return run(geneticAlgorithmSteps(blueprint, populationSize, generations, timeLimit, maxEvaluations), callback,
+               "Genetic algorithm")
+
+
+def geneticAlgorithmSteps(blueprint, populationSize=10, generations=20, timeLimit=None, maxEvaluations=None):
+    """
+    Genetic Algorithm: For 'generations' generations, all population reproduces randomly, between the best half of
+    solutions.
+    Stops earlier if 'timeLimit' (in seconds) or 'maxEvaluations' is reached.
+    Generator: yields a step (see 'anytime.Step') after each generation, with its best solution, and returns the best
+    solution of all generations (a generation can be worse than the previous one).
+    """
+    budget = Budget(blueprint, timeLimit, maxEvaluations)
+    best = BestSoFar()
+    print("Generating initial population...")
+    population = generateInitialPopulation(blueprint, populationSize, budget)
+    print("Generating initial population: Done! ({} solutions)".format(len(population)))
     # The population is ordered by value, so the first solution is the best one
-    return population[0]
+    best.update(population[0], int(evaluatePopulation(blueprint, population[:1])[0]))
+    yield Step(0, best.value, population[0], budget.evaluations())
+
+    for (iteration, population) in enumerate(evolveGenerations(blueprint, population, generations, budget), 1):
+        best.update(population[0], int(evaluatePopulation(blueprint, population[:1])[0]))
+        yield Step(iteration, best.value, population[0], budget.evaluations())
+
+    return best.solution
+
+
+def generateIsland(args):
+    """
+    Runs in a worker: generates the initial population of an island.
+    :return: The population and the number of evaluations made
+    """
+    (populationSize, seed, timeLimit, maxEvaluations) = args
+    random.seed(seed)
+    evaluations = parallel.workerBlueprint.evaluations
+    budget = Budget(parallel.workerBlueprint, timeLimit, maxEvaluations)
+    population = generateInitialPopulation(parallel.workerBlueprint, populationSize, budget)
+    return population, parallel.workerBlueprint.evaluations - evaluations
+
+
+def evolveIsland(args):
+    """
+    Runs in a worker: evolves the population of an island until the next migration.
+    :return: The population and the number of evaluations made
+    """
+    (population, generations, seed, timeLimit, maxEvaluations) = args
+    random.seed(seed)
+    evaluations = parallel.workerBlueprint.evaluations
+    budget = Budget(parallel.workerBlueprint, timeLimit, maxEvaluations)
+    population = evolve(parallel.workerBlueprint, population, generations, budget)
+    return population, parallel.workerBlueprint.evaluations - evaluations
+
+
+def migrate(populations, migrants, topology):
+    """
+    Copies the best 'migrants' solutions of each island to other islands, where they replace the worst solutions.
+    Topologies: - "ring": each island sends to the next one
+                - "complete": each island sends to every other island
+                - "random": each island sends to another island chosen randomly
+    """
+    islands = len(populations)
+    if topology == "ring":
+        routes = [(i, (i + 1) % islands) for i in range(islands)]
+    elif topology == "complete":
+        routes = [(i, j) for i in range(islands) for j in range(islands) if i != j]
+    elif topology == "random":
+        routes = [(i, random.choice([j for j in range(islands) if j != i])) for i in range(islands)]
+    else:
+        raise RuntimeError("Unknown topology: " + topology)
+
+    # Migrants are chosen before any island changes
+    emigrants = [population[:migrants] for population in populations]
+    for (source, destination) in routes:
+        population = populations[destination]
+        for solution in emigrants[source]:
+            if solution in population:
+                continue
+            # The population is ordered by value, so the last solution is the worst one
+            if len(population) > migrants:
+                population.pop()
+            population.insert(0, solution)
+
+
+def updateBest(blueprint, populations, best):
+    """
+    Gives the best solution of each island (the first one) to 'best' (see 'anytime.BestSoFar').
+    :return: The best solution of all islands
+    """
+    values = evaluatePopulation(blueprint, [population[0] for population in populations])
+    for (population, islandValue) in zip(populations, values):
+        best.update(population[0], int(islandValue))
+    return populations[int(values.argmax())][0]
+
+
+def islandGeneticAlgorithm(blueprint, islands=os.cpu_count(), populationSize=10, generations=20,
+                           migrationInterval=5, migrants=1, topology="ring", timeLimit=None, maxEvaluations=None,
+                           callback=None):
+    """
+    Island model of the Genetic Algorithm (see 'islandGeneticAlgorithmSteps'), run until it ends.
+    Reports each improvement (checked after each migration) to 'callback(solution, value)'.
+    :return: The best solution found by all islands.
+    """
+    return run(islandGeneticAlgorithmSteps(blueprint, islands, populationSize, generations, migrationInterval, migrants,
+                                           topology, timeLimit, maxEvaluations), callback, "Island genetic algorithm")
+
+
+def islandGeneticAlgorithmSteps(blueprint, islands=os.cpu_count(), populationSize=10, generations=20,
+                                migrationInterval=5, migrants=1, topology="ring", timeLimit=None, maxEvaluations=None):
+    """
+    Island model of the Genetic Algorithm: several populations evolve in separate processes and, every
+    'migrationInterval' generations, the best solutions of each island migrate to others, according to 'topology'.
+    Stops earlier if 'timeLimit' (in seconds) or 'maxEvaluations' is reached (each island gets an equal share of the
+    evaluations left).
+    Generator: yields a step (see 'anytime.Step') after each migration, with the best solution of all islands, and
+    returns the best solution found by all islands.
+    """
+    islands = max(2, islands)
+    budget = Budget(blueprint, timeLimit, maxEvaluations)
+    best = BestSoFar()
+
+    def islandBudget():
+        # Time and evaluations left for each island
+        evaluations = budget.remainingEvaluations()
+        return budget.remainingTime(), None if evaluations is None else evaluations // islands
+
+    with multiprocessing.Pool(islands, initializer=parallel.initWorker, initargs=(blueprint,)) as pool:
+        seeds = [random.randrange(2 ** 32) for _ in range(islands)]
+        print("Generating initial populations...")
+        results = pool.map(generateIsland, [(populationSize, seed) + islandBudget() for seed in seeds])
+        populations = [population for (population, _) in results]
+        print("Generating initial populations: Done! ({} islands)".format(islands))
+        blueprint.evaluations += sum(evaluations for (_, evaluations) in results)
+        islandsBest = updateBest(blueprint, populations, best)
+        yield Step(0, best.value, islandsBest, budget.evaluations())
+
+        iteration = 0
+        while iteration < generations and not budget.exhausted():
+            epoch = min(migrationInterval, generations - iteration)
+            seeds = [random.randrange(2 ** 32) for _ in range(islands)]
+            results = pool.map(evolveIsland, [(populations[i], epoch, seeds[i]) + islandBudget()
+                                               for i in range(islands)])
+            populations = [population for (population, _) in results]
+            blueprint.evaluations += sum(evaluations for (_, evaluations) in results)
+            iteration += epoch
+            islandsBest = updateBest(blueprint, populations, best)
+            yield Step(iteration, best.value, islandsBest, budget.evaluations())
+
+            if iteration < generations:
+                migrate(populations, migrants, topology)
+                populations = [sortPopulation(blueprint, population) for population in populations]
+
+    return best.solution
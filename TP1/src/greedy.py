@@ -0,0 +1,83 @@
+import heapq
+import numpy as np
+from backbone import Backbone
+from gainMap import GainMap
+from anytime import Budget, Step, run
+from utils import *
+
+
+def greedySolution(blueprint, timeLimit=None, maxEvaluations=None, callback=None):
+    """
+    Greedy constructive solver (see 'greedySteps'), run until it ends.
+    Each router added is reported to 'callback(solution, value)' (the solution doesn't have the unused routers).
+    :return: A solution with 'getMaxRouters' entries, unused ones are (-1, -1)
+    """
+    return run(greedySteps(blueprint, timeLimit, maxEvaluations), callback, "Greedy")
+
+
+def greedySteps(blueprint, timeLimit=None, maxEvaluations=None):
+    """
+    Constructive solver: repeatedly adds the router with the best marginal value,
+        coverage gain * 1000 - router cost - backbone cost * distance to the nearest backbone node,
+    while it's positive and the budget allows it.
+    Uses lazy greedy evaluation (CELF): the heap keeps a bound of the marginal of each position, and only the top one
+    is recomputed. Coverage gains only decrease as routers are added, so a recomputed top that stays on top is the best.
+    (The backbone distance also decreases, so the choice is approximate, which is acceptable for an initial solution.)
+    Stops earlier if 'timeLimit' (in seconds) or 'maxEvaluations' is reached.
+    Generator: every router added improves the solution, and yields a step (see 'anytime.Step') whose solution is a copy
+    without the unused routers. Returns a solution with 'getMaxRouters' entries, unused ones are (-1, -1).
+    """
+    maxRouters = blueprint.getMaxRouters()
+    positions = blueprint.validPositions
+    backbone = Backbone(blueprint)
+    nodes = [blueprint.backbonePosition]  # Positions connected to the backbone
+    solution = []
+    coverage = 0  # Bitset of the covered cells
+
+    # Every entry starts with the coverage of the position alone (its gain with no routers, see 'GainMap') and the
+    # stamp -1, so it's recomputed the first time it's on top
+    gains = GainMap(blueprint, np.zeros(blueprint.height * blueprint.width, dtype=np.int32)).gains
+    bounds = gains.astype(np.int64) * 1000 - blueprint.routerCost
+    heap = [(-int(bounds[i]), i, -1) for i in range(len(positions)) if bounds[i] > 0]
+    heapq.heapify(heap)
+    budget = Budget(blueprint, timeLimit, maxEvaluations)
+    yield Step(0, blueprint.budget, solution.copy(), budget.evaluations())
+
+    while heap and len(solution) < maxRouters and not budget.exhausted():
+        remaining = blueprint.budget - (backbone.weight * blueprint.backboneCost + len(solution) * blueprint.routerCost)
+        if remaining < blueprint.routerCost:
+            break
+
+        (_, i, stamp) = heapq.heappop(heap)
+        position = positions[i]
+        if stamp != len(solution):  # Outdated: recompute its marginal and put it back
+            blueprint.evaluations += 1
+            gain = blueprint.marginalGain(coverage, position)
+            if gain == 0:
+                continue
+            coords = np.array(nodes)
+            nearest = int(np.min(np.maximum(np.abs(coords[:, 0] - position[0]), np.abs(coords[:, 1] - position[1]))))
+            marginal = gain * 1000 - blueprint.routerCost - blueprint.backboneCost * nearest
+            if marginal > 0:
+                heapq.heappush(heap, (-marginal, i, len(solution)))
+            continue
+
+        # Up to date and on top: it's the best position. The exact backbone cost is checked against the budget.
+        backbone.checkpoint()
+        backbone.addTerminal(position)
+        if blueprint.budget - (backbone.weight * blueprint.backboneCost +
+                               (len(solution) + 1) * blueprint.routerCost) < 0:
+            backbone.rollback()
+            continue
+        backbone.commit()
+
+        (lowestBit, bits) = blueprint.accessCoverageBitsDict(position)
+        coverage |= bits << lowestBit
+        solution.append(position)
+        nodes.append(position)
+        remaining = blueprint.budget - (backbone.weight * blueprint.backboneCost + len(solution) * blueprint.routerCost)
+        yield Step(len(solution), 1000 * popcount(coverage) + remaining, solution.copy(), budget.evaluations())
+
+    while len(solution) < maxRouters:
+        solution.append((-1, -1))
+    return solution
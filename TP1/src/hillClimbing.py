@@ -1,175 +1,145 @@
+import collections
 import time
 import blueprint as bp
 from utils import *
+from evaluator import IncrementalEvaluator
+from parallel import NeighbourhoodEvaluator
+from anytime import Budget, BestSoFar, Step, run
 
 
-def hillClimbing(blueprint, solution):
+def hillClimbing(blueprint, solution, timeLimit=None, maxEvaluations=None, callback=None):
     """
-    Regular Hill climbing algorithm implementation.
+    Regular Hill climbing algorithm (see 'hillClimbingSteps'), run until it ends.
+    Reports each improvement to 'callback(solution, value)'.
     """
+    return run(hillClimbingSteps(blueprint, solution, timeLimit, maxEvaluations), callback, "Hill climbing")
 
-    maxRouters = getIndexOfLastNonEmptyRouter(solution) + 1
-    solutionValue = value(blueprint, solution)
-    print("\nStarting solution value:", solutionValue)
-    iteration = 0
-    upgrade = True
-    # Run until 30 upgrades were made, or until a full iteration with no upgrades
-    while iteration < 30 and upgrade:
-        upgrade = False
 
-        """
-        Initially, we tried to use this remove routers from the solutions because we realized, the hill climbing 
-        algorithms were not selecting any solutions with less than the max number of routers. 
-        Thus, we removed these 2 lines that were slowing down our code. 
-        
-        for numRouters in range(maxRouters, maxRouters//2, -1):
-            for i in range(numRouters):
-        """
-        for i in range(maxRouters):
-            for j in range(0, 2):
-                for k in range(0, 2):
-                    # Compute a neighbour and its value
-                    neighbourSolution, neighbourValue = neighbour(blueprint, solution, i, j, k, maxRouters)
-
-                    # Check if neighbour is valid
-                    if neighbourSolution is None and neighbourValue is None:
-                        continue
-
-                    # Check if neighbour is the same as the current solution
-                    if compareLists(solution, neighbourSolution):
-                        continue
-
-                    # If the neighbour is better than the current solution
-                    if neighbourValue > solutionValue:
-                        solutionValue = neighbourValue
-                        solution = neighbourSolution.copy()
-                        iteration += 1
-                        upgrade = True
-                        print("Upgrade!", str(i) + "/" + str(50) + ", Current score:", solutionValue)
-
-                        # Start over
-                        break
-
-                # Start over
-                if upgrade:
+def hillClimbingSteps(blueprint, solution, timeLimit=None, maxEvaluations=None):
+    """
+    Regular Hill climbing algorithm implementation (first improvement).
+    The routers to try are kept in a queue, in random order. A router whose moves don't improve the solution leaves
+    the queue (its "don't look" bit is set), and only comes back when a router near it moves (see 'affectedRouters'),
+    since the value of its moves can only change then. A router that moves goes back to the end of the queue.
+    It converges when the queue is empty: no router has an improving move.
+    Stops earlier if 'timeLimit' (in seconds) or 'maxEvaluations' is reached.
+    Generator: yields a step (see 'anytime.Step') after each router is tried, and returns the final solution.
+    """
+
+    # Neighbours only differ in one router, so they are scored by delta
+    evaluator = IncrementalEvaluator(blueprint, solution)
+    solutionValue = evaluator.value
+    step = 0
+    budget = Budget(blueprint, timeLimit, maxEvaluations)
+    best = BestSoFar()
+    best.update(solution, solutionValue)
+    yield Step(step, best.value, solution, budget.evaluations())
+
+    """
+    Initially, we tried to use this remove routers from the solutions because we realized, the hill climbing 
+    algorithms were not selecting any solutions with less than the max number of routers. 
+    Thus, we removed these 2 lines that were slowing down our code. 
+    
+    for numRouters in range(maxRouters, maxRouters//2, -1):
+        for i in range(numRouters):
+    """
+    routers = [i for (i, router) in enumerate(solution) if router != (-1, -1)]
+    random.shuffle(routers)
+    queue = collections.deque(routers)
+    queued = set(routers)  # Routers without the "don't look" bit
+
+    while queue and not budget.exhausted():
+        i = queue.popleft()
+        queued.discard(i)
+        upgrade = False
+        for j in range(0, 2):
+            for k in range(0, 2):
+                # Compute the value of a neighbour
+                oldPosition = solution[i]
+                newPosition = movedRouter(oldPosition, j, k)
+                neighbourValue = evaluator.evaluateMove(i, newPosition)
+
+                # Check if neighbour is valid
+                if neighbourValue is None:
+                    continue
+
+                # If the neighbour is better than the current solution
+                if neighbourValue > solutionValue:
+                    solutionValue = evaluator.applyMove(i, newPosition)
+                    solution = evaluator.solution.copy()
+                    best.update(solution, solutionValue)
+                    upgrade = True
                     break
-            # Start over
             if upgrade:
                 break
-    print("Final solution value:", solutionValue)
+
+        if upgrade:
+            # The router and the routers near it are tried again
+            for neighbourRouter in sorted(affectedRouters(blueprint, solution, [oldPosition, newPosition]) | {i}):
+                if neighbourRouter not in queued:
+                    queue.append(neighbourRouter)
+                    queued.add(neighbourRouter)
+        step += 1
+        yield Step(step, best.value, solution, budget.evaluations())
     return solution
 
 
-def hillClimbingSteepestAscent(blueprint, solution):
+def hillClimbingSteepestAscent(blueprint, solution, workers=1, timeLimit=None, maxEvaluations=None, callback=None):
     """
-    Hill climbing steepest ascent implementation.
-
-    In this algorithm, we avoided using the 'value' function, because of its heavy computational load.
-    As an alternative, we used the number of covered cells and the number of routers in a solution. We believe
-    this method is a good predicition to a solution's value. This prediction works well for maps with an unsignificant
-    backbone cost.
+    Hill climbing steepest ascent (see 'hillClimbingSteepestAscentSteps'), run until it ends.
+    Reports each improvement to 'callback(solution, value)'.
     """
+    return run(hillClimbingSteepestAscentSteps(blueprint, solution, workers, timeLimit, maxEvaluations), callback,
+               "Hill climbing steepest ascent")
 
-    print("\nStarting solution value:", value(blueprint, solution))
-
-    # Initial solution value prediciton
-    solutionCoveredCells = len(blueprint.getSolutionCoveredCells(solution))
-    solutionRouters = routersPlaced(solution)
 
-    upgrade = True
-    # Since the exact value of a solution cannot be computed, we stored the 3 best solutions, to guard ourselves
-    # from the situation of generating a solution which exceeds the budget.
-    steepest1 = (solution, solutionCoveredCells, solutionRouters)
-    steepest2 = (solution, solutionCoveredCells, solutionRouters)
-    steepest3 = (solution, solutionCoveredCells, solutionRouters)
-    maxRouters = getIndexOfLastNonEmptyRouter(solution) + 1
+def hillClimbingSteepestAscentSteps(blueprint, solution, workers=1, timeLimit=None, maxEvaluations=None):
+    """
+    Hill climbing steepest ascent implementation.
 
-    # Contains budget exceeding solutions
-    impossibleSolutions = {}
+    In each iteration, every neighbour of the current solution is scored and the best one is taken.
+    Initially, we avoided using the 'value' function here, because of its heavy computational load, and predicted a
+    solution's value with its number of covered cells and routers. Neighbours are now scored by delta, with their exact
+    value, and the neighbourhood is split between 'workers' processes.
+    Stops earlier if 'timeLimit' (in seconds) or 'maxEvaluations' is reached (checked after each neighbourhood).
+    Generator: yields a step (see 'anytime.Step') after each neighbourhood, and returns the final solution.
+    """
 
-    # Run until no upgrade is made
-    while upgrade:
-        upgrade = False
+    evaluator = IncrementalEvaluator(blueprint, solution)
+    maxRouters = getIndexOfLastNonEmptyRouter(solution) + 1
+    iteration = 0
+    budget = Budget(blueprint, timeLimit, maxEvaluations)
+    best = BestSoFar()
+    best.update(evaluator.solution, evaluator.value)
+    yield Step(iteration, best.value, evaluator.solution, budget.evaluations())
+
+    with NeighbourhoodEvaluator(blueprint, workers) as neighbourhood:
+        # Run until no upgrade is made
+        while not budget.exhausted():
+            """
+            Initially, we tried to use this remove routers from the solutions because we realized, the hill climbing 
+            algorithms were not selecting any solutions with less than the max number of routers. 
+            Thus, we removed these 2 lines that were slowing down our code. 
+
+            for numRouters in range(maxRouters, maxRouters//2, -1):
+                for i in range(numRouters):
+            """
+            moves = [(i, movedRouter(evaluator.solution[i], j, k)) for i in range(maxRouters) for j in range(0, 2) for k in range(0, 2)]
+            values = neighbourhood.evaluateMoves(evaluator, moves)
+
+            # Find the best neighbour (invalid neighbours and neighbours exceeding the budget have no value)
+            steepestMove, steepestValue = None, evaluator.value
+            for (move, moveValue) in zip(moves, values):
+                if moveValue is not None and moveValue > steepestValue:
+                    steepestMove, steepestValue = move, moveValue
+
+            # If there was no upgrade
+            if steepestMove is None:
+                break
 
-        """
-        Initially, we tried to use this remove routers from the solutions because we realized, the hill climbing 
-        algorithms were not selecting any solutions with less than the max number of routers. 
-        Thus, we removed these 2 lines that were slowing down our code. 
-
-        for numRouters in range(maxRouters, maxRouters//2, -1):
-            for i in range(numRouters):
-        """
-        for i in range(maxRouters):
-            for j in range(0, 2):
-                for k in range(0, 2):
-                    # Compute a neighbour solution and its value
-                    neighbourSolution = neighbour(blueprint, solution, i, j, k, maxRouters, False)
-
-                    # Check if neighbour is valid
-                    if neighbourSolution == (None, None):
-                        continue
-
-                    skip = True
-                    # Check if a solution has been marked as impossible (exceeds the budget)
-                    try:
-                        impossibleSolutions[tuple(neighbourSolution)]
-                    except KeyError:
-                        skip = False
-                    if skip:
-                        continue
-
-                    # Check if neighbour and current solution are the same
-                    if compareLists(solution, neighbourSolution):
-                        continue
-
-                    # Neighbour value prediction
-                    neighbourCoveredCells = len(blueprint.getSolutionCoveredCells(neighbourSolution))
-                    neighbourSolutionRouters = routersPlaced(neighbourSolution)
-
-                    # A covered cell is 10x more valuable then a router.
-                    # Checks if neighbour is better than the current best solution
-                    if neighbourCoveredCells * 10 + blueprint.getMaxRouters() - neighbourSolutionRouters > steepest1[1] * 10 + blueprint.getMaxRouters() - steepest1[2]:
-                        # Push back solutions
-                        steepest3 = steepest2
-                        steepest2 = steepest1
-                        steepest1 = (neighbourSolution, neighbourCoveredCells, neighbourSolutionRouters)
-                        upgrade = True
-        # If there was no upgrade
-        if not upgrade:
-            break
-
-        steepestValue = value(blueprint, steepest1[0])
-        # Check if 'steepest1' does not exceed the budget
-        if steepestValue is not None:
-            print("Upgrade! Current score:", steepestValue)
-            solution, solutionCoveredCells, solutionRouters = steepest1
-            steepest2 = steepest1
-            steepest3 = steepest1
-            continue
-        # 'steepest1' exceeded the budget. Mark it as impossible
-        impossibleSolutions[tuple(steepest1[0])] = True
-        steepestValue = value(blueprint, steepest2[0])
-        # Check if 'steepest2' does not exceed the budget
-        if steepestValue is not None:
-            print("Upgrade! Current score:", steepestValue)
-            solution, solutionCoveredCells, solutionRouters = steepest2
-            steepest1 = steepest2
-            steepest3 = steepest2
-            continue
-        # 'steepest2' exceeded the budget. Mark it as impossible
-        impossibleSolutions[tuple(steepest2[0])] = True
-        steepestValue = value(blueprint, steepest3[0])
-        # Check if 'steepest3' does not exceed the budget
-        if steepestValue is not None:
-            print("Upgrade! Current score:", steepestValue)
-            solution, solutionCoveredCells, solutionRouters = steepest3
-            steepest2 = steepest3
-            steepest1 = steepest3
-            continue
-        # 'steepest3' exceeded the budget. Mark it as impossible
-        impossibleSolutions[tuple(steepest3)] = True
-        # If all 3 solutions exceed the budget, compute new ones
-
-    print("Final solution value:", value(blueprint, solution))
-    return solution
+            neighbourhood.applyMove(evaluator, *steepestMove)
+            best.update(evaluator.solution, evaluator.value)
+            iteration += 1
+            yield Step(iteration, best.value, evaluator.solution, budget.evaluations())
 
+    return evaluator.solution
@@ -0,0 +1,70 @@
+"""
+Counters and cumulative timers of the hot functions, to see how the time of an algorithm is split.
+Instrumentation is off by default: the instrumented functions only check a flag. Times are inclusive (the time of
+'value' includes the time of the 'accessMstDict' calls it makes), and calls made in worker processes aren't counted.
+"""
+import functools
+import sys
+import time
+
+enabled = False
+# Name of each instrumented function -> [calls, cumulative seconds]
+timers = {}
+
+
+def instrumented(name):
+    """
+    Decorator that counts the calls of a function and their time, with the given name, when instrumentation is enabled.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            startTime = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                timer = timers.setdefault(name, [0, 0.0])
+                timer[0] += 1
+                timer[1] += time.perf_counter() - startTime
+        return wrapper
+    return decorator
+
+
+def enable(on=True):
+    """
+    Turns the instrumentation on (or off).
+    """
+    global enabled
+    enabled = on
+
+
+def reset():
+    """
+    Clears the counters and timers.
+    """
+    timers.clear()
+
+
+def report():
+    """
+    :return: Dictionary with the calls and seconds of each instrumented function, the slowest first
+    """
+    return {name: {"calls": calls, "seconds": seconds}
+            for (name, (calls, seconds)) in sorted(timers.items(), key=lambda item: -item[1][1])}
+
+
+def printReport(runtime=None, caches=None, file=sys.stdout):
+    """
+    Prints the time of each instrumented function and, if given, its share of 'runtime' and the cache counters
+    (as returned by 'Blueprint.cacheStats').
+    """
+    print("{:28} {:>10} {:>10} {:>12} {:>8}".format("phase", "calls", "seconds", "us per call", "share"), file=file)
+    for (name, timer) in report().items():
+        share = "{:.1%}".format(timer["seconds"] / runtime) if runtime else ""
+        print("{:28} {:>10} {:>10.3f} {:>12.1f} {:>8}".format(name, timer["calls"], timer["seconds"],
+                                                              timer["seconds"] / timer["calls"] * 1e6, share), file=file)
+    for (name, stats) in (caches or {}).items():
+        print("cache {:22} {:>10} hits {:>10} misses, hit rate {:.1%}".format(
+            name, stats["hits"], stats["misses"], stats["hitRate"]), file=file)
@@ -1,6 +1,6 @@
 import utils
 from hillClimbing import *
-import aStar
+import backbone
 
 
 class Node:
@@ -84,12 +84,13 @@ class Graph:
 
     def getPaths(self, blueprint):
         """
-        For each edge, this function calculates the path between two nodes, using the A* algorithm.
+        For each edge, this function calculates the path between two nodes. Backbone cells can be walls,
+        so the shortest path is a straight line and doesn't need the A* algorithm.
         :return: List of cells which are part of the paths
         """
         backboneCells = []
         for edge in self.edges:
-            path = aStar.aStar(blueprint, edge.nodeFrom.coord, edge.nodeTo.coord)
+            path = backbone.rasterizedPath(edge.nodeFrom.coord, edge.nodeTo.coord)
             backboneCells.extend(path)
         return backboneCells
 
@@ -1,5 +1,7 @@
+import os
 import random
 import geneticAlgorithm
+import greedy
 import hillClimbing
 import tabuSearch
 import simulatedAnnealing
@@ -7,6 +9,25 @@ import utils
 import blueprint as bp
 import time
 
+# Number of processes used by the algorithms that score neighbourhoods in parallel
+WORKERS = os.cpu_count()
+# Directory of the on-disk cache of the maps (grid and coverage)
+CACHE_DIRECTORY = "../cache"
+
+
+def initialSolution(blueprint, strategy):
+    """
+    Generates the initial solution of the local search algorithms.
+    :param strategy: "random" places routers randomly, "greedy" uses the greedy constructive solver
+    """
+    print("Generating initial solution...")
+    if strategy == "greedy":
+        solution = greedy.greedySolution(blueprint)
+    else:
+        solution = utils.generateSolution(blueprint)
+    print("Generated initial solution.")
+    return solution
+
 
 def menu():
     print("IART - Router Placement")
@@ -46,7 +67,9 @@ def menu():
             print("File not found\n")
             continue
 
-        blueprint = bp.Blueprint(file)
+        blueprint = bp.Blueprint(file, cacheDirectory=CACHE_DIRECTORY)
+        print("Computing coverage...")
+        blueprint.precomputeCoverage(WORKERS)
 
         print("Choose algorithm to run")
         print("[1] Simulated Annealing")
@@ -54,39 +77,52 @@ def menu():
         print("[3] Hill Climbing: Steepest Ascent")
         print("[4] Genetic Algorithm")
         print("[5] Tabu Search")
+        print("[6] Genetic Algorithm: Island Model")
+        print("[7] Greedy")
+        print("[8] Parallel Tempering")
         print("[0] Quit")
         val = input("Option: ")
 
+        strategy = "random"
+        if val in (str(1), str(2), str(3), str(5), str(8)):
+            print("Choose initial solution")
+            print("[1] Random")
+            print("[2] Greedy")
+            if input("Option: ") == str(2):
+                strategy = "greedy"
+
         algorithmName = ""
 
         startTime = time.time()
         if val == str(1):
-            print("Generating initial solution...")
-            solution = utils.generateSolution(blueprint)
-            print("Generated initial solution.")
+            solution = initialSolution(blueprint, strategy)
             solution = simulatedAnnealing.simulatedAnnealing(blueprint, solution)
             algorithmName = "annealing"
         elif val == str(2):
-            print("Generating initial solution...")
-            solution = utils.generateSolution(blueprint)
-            print("Generated initial solution.")
+            solution = initialSolution(blueprint, strategy)
             solution = hillClimbing.hillClimbing(blueprint, solution)
             algorithmName = "hill_climbing_regular"
         elif val == str(3):
-            print("Generating initial solution...")
-            solution = utils.generateSolution(blueprint)
-            print("Generated initial solution.")
-            solution = hillClimbing.hillClimbingSteepestAscent(blueprint, solution)
+            solution = initialSolution(blueprint, strategy)
+            solution = hillClimbing.hillClimbingSteepestAscent(blueprint, solution, WORKERS)
             algorithmName = "hill_climbing_steepest"
         elif val == str(4):
             solution = geneticAlgorithm.geneticAlgorithm(blueprint)
             algorithmName = "genetic"
         elif val == str(5):
-            print("Generating initial solution...")
-            solution = utils.generateSolution(blueprint)
-            print("Generated initial solution.")
-            solution = tabuSearch.tabuSearch(blueprint, solution)
+            solution = initialSolution(blueprint, strategy)
+            solution = tabuSearch.tabuSearch(blueprint, solution, WORKERS)
             algorithmName = "tabu"
+        elif val == str(6):
+            solution = geneticAlgorithm.islandGeneticAlgorithm(blueprint, WORKERS)
+            algorithmName = "genetic_islands"
+        elif val == str(7):
+            solution = greedy.greedySolution(blueprint)
+            algorithmName = "greedy"
+        elif val == str(8):
+            solution = initialSolution(blueprint, strategy)
+            solution = simulatedAnnealing.parallelTempering(blueprint, solution, WORKERS)
+            algorithmName = "parallel_tempering"
         elif val == str(0):
             break
         else:
@@ -104,6 +140,7 @@ def menu():
         print(f"\nTime: {endTime - startTime} seconds\n")
         blueprint.plotSolution(solution, "../out/" + outFileName + ".png")
         utils.printSolToFile(solution, endTime - startTime, blueprint, "../out/" + outFileName + ".txt")
+        blueprint.printCacheStats()
 
         print("------------------------------------------------------------------------------------------------")
                 
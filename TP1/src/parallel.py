@@ -0,0 +1,129 @@
+import multiprocessing
+import os
+from evaluator import IncrementalEvaluator
+
+# State of each worker process
+workerBlueprint = None
+workerEvaluator = None
+workerVersion = None  # (generation, moves applied) of 'workerEvaluator', see 'NeighbourhoodEvaluator'
+
+
+def initWorker(blueprint):
+    """
+    Runs once in each worker. The blueprint (and the coverage already computed) is inherited from the main process.
+    """
+    global workerBlueprint, workerEvaluator, workerVersion
+    workerBlueprint = blueprint
+    workerEvaluator = None
+    workerVersion = None
+
+
+def scoreMoves(args):
+    """
+    Runs in a worker: scores a batch of moves of a solution.
+    The worker keeps its evaluator between batches, and brings it up to date by applying the moves made since its
+    version. It's only rebuilt, from 'solution', when it's from another generation or too old for 'applied'.
+    :return: The pid of the worker and the value of each move
+    """
+    global workerEvaluator, workerVersion
+    (generation, start, applied, solution, moves) = args
+    end = start + len(applied)
+    if workerVersion is not None and workerVersion[0] == generation and start <= workerVersion[1] <= end:
+        for (routerIndex, newPosition) in applied[workerVersion[1] - start:]:
+            workerEvaluator.applyMove(routerIndex, newPosition)
+    else:
+        workerEvaluator = IncrementalEvaluator(workerBlueprint, solution)
+    workerVersion = (generation, end)
+    return os.getpid(), [workerEvaluator.evaluateMove(routerIndex, newPosition) for (routerIndex, newPosition) in moves]
+
+
+def coverageChunk(args):
+    """
+    Runs in a worker: computes the coverage of a chunk of 'validPositions'.
+    """
+    (start, end) = args
+    return workerBlueprint.getChunkCoverage(start, end)
+
+
+class NeighbourhoodEvaluator:
+    """
+    Scores the moves of a neighbourhood in a pool of processes. Each worker holds its own copy of the blueprint.
+    A move is (routerIndex, newPosition), like in IncrementalEvaluator. With 1 worker, moves are scored in this process.
+    Moves made with 'applyMove' are sent to the workers, which apply them to their own evaluators. A solution changed
+    in any other way starts a new generation, and the workers rebuild their evaluators.
+    Use it in a 'with' statement, so the pool is closed.
+    """
+    def __init__(self, blueprint, workers=1):
+        self.workers = max(1, workers)
+        self.pool = None
+        self.evaluator = None  # Evaluator whose moves are sent
+        self.solution = None  # Its solution after the last move sent (each move makes a new list)
+        self.generation = 0
+        self.start = 0  # Number of moves made before the first one of 'applied'
+        self.applied = []
+        self.workerVersions = {}  # Moves applied by each worker (pid) in this generation
+        if self.workers > 1:
+            self.pool = multiprocessing.Pool(self.workers, initializer=initWorker, initargs=(blueprint,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """
+        Stops the worker processes.
+        """
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+
+    def applyMove(self, evaluator, routerIndex, newPosition):
+        """
+        Makes a move in the current solution of an IncrementalEvaluator (see 'IncrementalEvaluator.applyMove'), and
+        keeps it to send to the workers.
+        """
+        # Only moves of the solution the workers know are kept, any other change starts a new generation anyway
+        known = evaluator is self.evaluator and evaluator.solution is self.solution
+        value = evaluator.applyMove(routerIndex, newPosition)
+        if known and value is not False:
+            self.applied.append((routerIndex, newPosition))
+            self.solution = evaluator.solution
+        return value
+
+    def evaluateMoves(self, evaluator, moves):
+        """
+        Scores moves of the current solution of an IncrementalEvaluator.
+        :return: The value of each move, None if it's not valid or exceeds the budget.
+        """
+        if self.pool is None or len(moves) < self.workers:
+            return [evaluator.evaluateMove(routerIndex, newPosition) for (routerIndex, newPosition) in moves]
+
+        if evaluator is not self.evaluator or evaluator.solution is not self.solution:
+            # Another evaluator, or moves not made with 'applyMove': the workers start again from the solution
+            self.evaluator = evaluator
+            self.solution = evaluator.solution
+            self.generation += 1
+            self.start = 0
+            self.applied = []
+            self.workerVersions = {}
+        else:
+            # Moves every worker already applied aren't sent again
+            oldest = min(self.workerVersions.values(), default=self.start)
+            del self.applied[:oldest - self.start]
+            self.start = oldest
+        # The solution is only needed by workers that haven't scored moves of this generation yet
+        solution = evaluator.solution if len(self.workerVersions) < self.workers else None
+        version = self.start + len(self.applied)
+
+        # Moves scored by the workers are counted here, since each worker has its own copy of the blueprint
+        evaluator.blueprint.evaluations += len(moves)
+        # One batch per worker. Strided batches spread the routers evenly.
+        batches = [(self.generation, self.start, self.applied, solution, moves[k::self.workers])
+                   for k in range(self.workers)]
+        values = [None] * len(moves)
+        for (k, (pid, batchValues)) in enumerate(self.pool.map(scoreMoves, batches)):
+            self.workerVersions[pid] = version
+            values[k::self.workers] = batchValues
+        return values
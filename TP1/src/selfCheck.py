@@ -0,0 +1,219 @@
+"""
+Self-checks of the fast and incremental computations against straightforward computations from scratch, on random
+positions, solutions and moves:
+    - router coverage with the wall summed-area table (and the precomputed CSR coverage) against a scan of the walls
+      between the router and each cell;
+    - coverage counted with bitsets against a set of the covered cells;
+    - the incremental backbone tree (adds, removes, moves, rollbacks) against a tree rebuilt with Prim's algorithm;
+    - move values of the IncrementalEvaluator against 'utils.value' of the moved solution;
+    - the incremental GainMap against a GainMap built from scratch.
+Run it after changing any of them. It stops with an AssertionError at the first mismatch.
+Example (in the src directory):
+    python selfCheck.py ../inputs/charleston_road.in --moves 1000
+"""
+import argparse
+import random
+import time
+import numpy as np
+
+import blueprint as bp
+import utils
+from backbone import Backbone, chebyshevDistance
+from evaluator import IncrementalEvaluator
+from gainMap import GainMap
+
+# Inputs checked by default: a small one and a medium one
+INPUTS = ["../inputs/example.in", "../inputs/charleston_road.in"]
+
+
+def check(condition, message):
+    """
+    Raises an AssertionError if 'condition' is false (unlike 'assert', it isn't skipped with python -O).
+    """
+    if not condition:
+        raise AssertionError(message)
+
+
+def referenceCoverage(blueprint, router):
+    """
+    Coverage of a router computed cell by cell, looking for walls in the rectangle between the router and each cell.
+    :return: Sorted list of flattened positions
+    """
+    (a, b) = router
+    radius = blueprint.routerRadius
+    cells = []
+    for x in range(max(0, a - radius), min(blueprint.height - 1, a + radius) + 1):
+        for y in range(max(0, b - radius), min(blueprint.width - 1, b + radius) + 1):
+            walls = blueprint.wallMask[min(a, x):max(a, x) + 1, min(b, y):max(b, y) + 1]
+            if blueprint.targetMask[x, y] and not walls.any():
+                cells.append(x * blueprint.width + y)
+    return cells
+
+
+def referenceMstWeight(nodes):
+    """
+    Weight of the minimum spanning tree of 'nodes' with the Chebyshev distance, with a plain O(n^2) Prim's algorithm.
+    """
+    nodes = list(nodes)
+    if len(nodes) < 2:
+        return 0
+    distance = {node: chebyshevDistance(nodes[0], node) for node in nodes[1:]}
+    weight = 0
+    while distance:
+        node = min(distance, key=distance.get)
+        weight += distance.pop(node)
+        for other in distance:
+            distance[other] = min(distance[other], chebyshevDistance(node, other))
+    return weight
+
+
+def randomSolution(blueprint, routers):
+    """
+    Random solution with 'routers' routers in different valid positions, padded with (-1, -1).
+    """
+    solution = random.sample(blueprint.validPositions, min(routers, len(blueprint.validPositions)))
+    return solution + [(-1, -1)] * max(0, blueprint.getMaxRouters() - len(solution))
+
+
+def randomEvaluatorMove(blueprint, evaluator):
+    """
+    Random move of the evaluator's solution: a removal, a jump to a random position or a move of 1 cell.
+    :return: (routerIndex, newPosition), or None if the solution has no routers
+    """
+    if evaluator.numRouters == 0:
+        return None
+    lastIx = utils.getIndexOfLastNonEmptyRouter(evaluator.solution)
+    choice = random.random()
+    if choice < 0.1 and evaluator.numRouters > 1:
+        return random.randint(0, lastIx), (-1, -1)
+    if choice < 0.3:
+        return random.randint(0, lastIx), random.choice(blueprint.validPositions)
+    return utils.randomMove(evaluator.solution)
+
+
+def checkCoverage(blueprint, samples):
+    """
+    Checks the coverage of random positions, computed and precomputed, against 'referenceCoverage'.
+    """
+    for router in random.sample(blueprint.validPositions, min(samples, len(blueprint.validPositions))):
+        expected = referenceCoverage(blueprint, router)
+        computed = blueprint.getCellCoverageIndices(router).tolist()
+        check(computed == expected, "coverage of {}: {} cells instead of {}".format(router, len(computed), len(expected)))
+        precomputed = blueprint.precomputedCoverage(router)
+        if precomputed is not None:
+            check(precomputed.tolist() == expected, "precomputed coverage of {} differs".format(router))
+
+
+def checkCoverageBits(blueprint, solutions):
+    """
+    Checks the covered cells count of random solutions (bitsets) against a set of the covered cells.
+    """
+    for _ in range(solutions):
+        solution = randomSolution(blueprint, random.randint(0, blueprint.getMaxRouters()))
+        expected = set()
+        for router in solution:
+            if router != (-1, -1):
+                expected.update(referenceCoverage(blueprint, router))
+        count = blueprint.getSolutionCoveredCellsCount(solution)
+        check(count == len(expected), "covered cells: {} instead of {}".format(count, len(expected)))
+
+
+def checkBackbone(blueprint, steps, routers=30):
+    """
+    Makes random changes to a Backbone, each one kept or rolled back, and checks its weight after each one against
+    a tree rebuilt from scratch and 'referenceMstWeight'.
+    """
+    backbone = Backbone(blueprint, randomSolution(blueprint, routers))
+    for _ in range(steps):
+        terminals = list(backbone.terminals)
+        backbone.checkpoint()
+        choice = random.random()
+        if choice < 0.3 or not terminals:
+            backbone.addTerminal(random.choice(blueprint.validPositions))
+        elif choice < 0.6:
+            backbone.removeTerminal(random.choice(terminals))
+        else:
+            backbone.moveTerminal(random.choice(terminals), random.choice(blueprint.validPositions))
+        if random.random() < 0.5:
+            backbone.rollback()
+        else:
+            backbone.commit()
+
+        solution = [node for (node, count) in backbone.terminals.items() for _ in range(count)]
+        rebuilt = Backbone(blueprint, solution)
+        check(backbone.weight == rebuilt.weight, "backbone weight {} instead of {}".format(backbone.weight, rebuilt.weight))
+        check(rebuilt.weight == referenceMstWeight(rebuilt.adjacency),
+              "rebuilt backbone weight {} isn't minimum".format(rebuilt.weight))
+        edges = sum(len(neighbours) for neighbours in backbone.adjacency.values()) // 2
+        check(edges == len(backbone.adjacency) - 1, "the backbone isn't a tree")
+
+
+def checkEvaluator(blueprint, moves):
+    """
+    Checks the value of random moves, and of the solution after the moves made, against 'utils.value'.
+    """
+    evaluator = IncrementalEvaluator(blueprint, randomSolution(blueprint, blueprint.getMaxRouters() // 2))
+    check(evaluator.value == utils.value(blueprint, evaluator.solution), "initial value differs")
+    for _ in range(moves):
+        move = randomEvaluatorMove(blueprint, evaluator)
+        if move is None:
+            break
+        candidate = evaluator.candidate(*move)
+        moveValue = evaluator.evaluateMove(*move)
+        if candidate is None:
+            check(moveValue is None, "invalid move {} has a value".format(move))
+            continue
+        expected = utils.value(blueprint, candidate)
+        check(moveValue == expected, "move {}: value {} instead of {}".format(move, moveValue, expected))
+        if moveValue is not None and random.random() < 0.5:
+            evaluator.applyMove(*move)
+            check(evaluator.value == utils.value(blueprint, evaluator.solution),
+                  "value after move {} differs".format(move))
+
+
+def checkGainMap(blueprint, moves):
+    """
+    Makes random moves (a third of them relocations to the best position) and checks the gains against a GainMap
+    built from scratch, every 10 moves and at the end.
+    """
+    evaluator = IncrementalEvaluator(blueprint, randomSolution(blueprint, blueprint.getMaxRouters() // 2))
+    gains = evaluator.trackGains()
+    for i in range(1, moves + 1):
+        move = randomEvaluatorMove(blueprint, evaluator)
+        if move is None:
+            break
+        if random.random() < 1 / 3:
+            move = (move[0], gains.bestPosition()[0])
+        if evaluator.evaluateMove(*move) is not None:
+            evaluator.applyMove(*move)
+        if i % 10 == 0 or i == moves:
+            rebuilt = GainMap(blueprint, evaluator.coverageCount)
+            wrong = int(np.count_nonzero(rebuilt.gains != gains.gains))
+            check(wrong == 0, "{} gains differ after {} moves".format(wrong, i))
+
+
+def parseArguments(arguments=None):
+    parser = argparse.ArgumentParser(description="Router placement: checks the incremental computations.")
+    parser.add_argument("inputs", nargs="*", default=INPUTS, help="input files (default: " + " ".join(INPUTS) + ")")
+    parser.add_argument("--moves", type=int, default=300, help="random moves (or changes) of each check (default: 300)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed (default: 0)")
+    return parser.parse_args(arguments)
+
+
+def main(arguments=None):
+    args = parseArguments(arguments)
+    random.seed(args.seed)
+    checks = [("coverage", checkCoverage), ("coverage bits", checkCoverageBits), ("backbone", checkBackbone),
+              ("evaluator", checkEvaluator), ("gain map", checkGainMap)]
+    for inputFile in args.inputs:
+        blueprint = bp.Blueprint(inputFile)
+        blueprint.precomputeCoverage()
+        for (name, function) in checks:
+            startTime = time.time()
+            # The coverage checks scan every cell, so they use fewer samples
+            function(blueprint, args.moves if name not in ("coverage", "coverage bits") else max(1, args.moves // 10))
+            print("{} {}: OK ({:.2f}s)".format(inputFile, name, time.time() - startTime))
+
+
+if __name__ == "__main__":
+    main()
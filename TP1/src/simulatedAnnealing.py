@@ -1,58 +1,225 @@
 import blueprint as bp
 from utils import *
+from evaluator import IncrementalEvaluator
+from anytime import Budget, BestSoFar, Step, run
+import cooling
 import math
+import multiprocessing
+import os
+import parallel
 import time
 
+# Invalid neighbours drawn in a row before the search stops (the routers may have no valid move at all)
+MAX_INVALID_NEIGHBOURS = 10000
 
-def simulatedAnnealing(blueprint, solution):
+
+def simulatedAnnealing(blueprint, solution, timeLimit=None, maxEvaluations=None, callback=None, schedule="geometric",
+                       initialTemp=None, moves=None, reheats=0, stagnation=1000, relocate=0):
+    """
+    Simulated annealing algorithm (see 'simulatedAnnealingSteps'), run until it ends.
+    Returns the best solution found, and reports each improvement to 'callback(solution, value)'.
+    """
+    return run(simulatedAnnealingSteps(blueprint, solution, timeLimit, maxEvaluations, schedule, initialTemp, moves,
+                                       reheats, stagnation, relocate), callback, "Simulated annealing")
+
+
+def simulatedAnnealingSteps(blueprint, solution, timeLimit=None, maxEvaluations=None, schedule="geometric",
+                            initialTemp=None, moves=None, reheats=0, stagnation=1000, relocate=0):
     """
     Simulated annealing algorithm implementation.
-    Configuration:  - initial temperature of 10000
-                    - end temperature of 10
-                    - linear cooling schedule with a factor of 0.99
-                    - 10 iterations per temperature
-    """
-    # Configuration
-    initialTemp = 10000
-    finalTemp = 10
-    alpha = 0.99
-    currentIter = 1
-
-    currentTemp = initialTemp
-    currentSolution = solution.copy()
-    currentSolutionValue = value(blueprint, currentSolution)
-
-    print("Initial solution value:", currentSolutionValue)
-
-    while currentTemp > finalTemp:
-        print("Temperature:", currentTemp)
-        # 10 iterations per temperature
-        for _ in range(10):
-            # Accept only a valid neighbour
-            while True:
-                neighbour, neighbourValue = randomNeighbour(blueprint, solution)
-                if (neighbour, neighbourValue) == (None, None):
-                    continue
-                break
-
-            delta = neighbourValue - currentSolutionValue
-
-            # Neighbour is better that current solution
-            if delta > 0:
-                currentSolution, currentSolutionValue = neighbour, neighbourValue
-                print("Upgrade! Value:", currentSolutionValue)
-            elif delta == 0:
-                pass
-            # If Neighbour is worse, accept it with a probability of e^(delta/temperature)
+    Configuration:  - schedule: name of the cooling schedule (see 'cooling.SCHEDULES'). "geometric" is the original
+                      one, 10 iterations per temperature and a factor of 0.99, down to 1/1000 of the initial temperature
+                    - initialTemp: initial temperature. By default, it's estimated from the deltas of random moves of
+                      the initial solution (see 'cooling.estimateInitialTemperature')
+                    - moves: length of the run of the adaptive schedules. By default, the budget, or the length of the
+                      original schedule if there's no budget
+                    - reheats: times the temperature can go back to half the initial one, when the best solution
+                      doesn't improve for 'stagnation' iterations
+                    - relocate: probability (below 1) of moving a random router to the position that covers the most
+                      cells not covered yet (see 'gainMap.GainMap'), instead of moving it by 1 cell
+    Stops earlier if 'timeLimit' (in seconds) or 'maxEvaluations' is reached.
+    Generator: yields a step (see 'anytime.Step') after each iteration, and returns the best solution found.
+    """
+    iteration = 0
+    lastImprovement = 0
+
+    budget = Budget(blueprint, timeLimit, maxEvaluations)
+    # Neighbours only differ in one router, so they are scored by delta
+    evaluator = IncrementalEvaluator(blueprint, solution)
+    currentSolutionValue = evaluator.value
+    best = BestSoFar()
+    best.update(evaluator.solution, currentSolutionValue)
+    yield Step(iteration, best.value, evaluator.solution, budget.evaluations())
+
+    if initialTemp is None:
+        initialTemp = cooling.estimateInitialTemperature(evaluator) or cooling.INITIAL_TEMPERATURE
+    coolingSchedule = cooling.SCHEDULES[schedule](initialTemp)
+    if moves is None and budget.progress() is None:
+        moves = cooling.DEFAULT_MOVES
+    gains = evaluator.trackGains() if relocate > 0 else None
+
+    while not budget.exhausted():
+        progress = budget.progress() or 0
+        if moves is not None:
+            progress = max(progress, iteration / moves)
+        if coolingSchedule.frozen(progress):
+            break
+
+        # Accept only a valid neighbour
+        invalidNeighbours = 0
+        while True:
+            if budget.exhausted() or invalidNeighbours == MAX_INVALID_NEIGHBOURS:
+                return best.solution
+            if relocate > 0 and random.uniform(0, 1) < relocate:
+                routerIndex = random.randint(0, getIndexOfLastNonEmptyRouter(evaluator.solution))
+                newPosition = gains.bestPosition()[0]
             else:
-                print("Probability: " + str(math.exp(delta / currentTemp)) +
-                      "; delta: " + str(delta))
-                if random.uniform(0, 1) < math.exp(delta / currentTemp):
-                    currentSolution, currentSolutionValue = neighbour, neighbourValue
-                    print("Upgrade! Value: " + str(currentSolutionValue))
-        # decrement the temperature
-        currentTemp = initialTemp * alpha ** currentIter
-        currentIter += 1
-
-    print("Solution value: " + str(currentSolutionValue))
-    return currentSolution
+                routerIndex, newPosition = randomMove(evaluator.solution)
+            neighbourValue = evaluator.evaluateMove(routerIndex, newPosition)
+            if neighbourValue is None:
+                invalidNeighbours += 1
+                continue
+            break
+
+        delta = neighbourValue - currentSolutionValue
+        accepted = False
+
+        # Neighbour is better that current solution
+        if delta > 0:
+            currentSolutionValue = evaluator.applyMove(routerIndex, newPosition)
+            accepted = True
+            if best.update(evaluator.solution, currentSolutionValue):
+                lastImprovement = iteration
+        elif delta == 0:
+            pass
+        # If Neighbour is worse, accept it with a probability of e^(delta/temperature)
+        elif random.uniform(0, 1) < math.exp(delta / coolingSchedule.temperature):
+            currentSolutionValue = evaluator.applyMove(routerIndex, newPosition)
+            accepted = True
+        coolingSchedule.update(delta, accepted, progress)
+        iteration += 1
+
+        # Reheat if the search is stuck
+        if reheats > 0 and iteration - lastImprovement >= stagnation:
+            coolingSchedule.reheat(initialTemp / 2)
+            reheats -= 1
+            lastImprovement = iteration
+        yield Step(iteration, best.value, evaluator.solution, budget.evaluations())
+
+    return best.solution
+
+
+def temperatureLadder(replicas, highest=10000, lowest=10):
+    """
+    Temperatures of the replicas of parallel tempering, in geometric progression from 'lowest' to 'highest'.
+    """
+    if replicas == 1:
+        return [lowest]
+    return [lowest * (highest / lowest) ** (i / (replicas - 1)) for i in range(replicas)]
+
+
+def annealReplica(args):
+    """
+    Runs in a worker: makes 'moves' moves of a replica at a fixed temperature, accepting worse neighbours with a
+    probability of e^(delta/temperature), like 'simulatedAnnealing'.
+    :return: The final solution and its value, the best solution and its value, and the number of evaluations made
+    """
+    (solution, temperature, moves, seed, timeLimit, maxEvaluations) = args
+    random.seed(seed)
+    blueprint = parallel.workerBlueprint
+    evaluations = blueprint.evaluations
+    budget = Budget(blueprint, timeLimit, maxEvaluations)
+    evaluator = IncrementalEvaluator(blueprint, solution)
+    currentValue = evaluator.value
+    best = BestSoFar()
+    best.update(evaluator.solution, currentValue)
+
+    for _ in range(moves):
+        if budget.exhausted():
+            break
+        routerIndex, newPosition = randomMove(evaluator.solution)
+        neighbourValue = evaluator.evaluateMove(routerIndex, newPosition)
+        if neighbourValue is None:
+            continue
+        delta = neighbourValue - currentValue
+        if delta > 0:
+            currentValue = evaluator.applyMove(routerIndex, newPosition)
+            best.update(evaluator.solution, currentValue)
+        elif delta < 0 and random.uniform(0, 1) < math.exp(delta / temperature):
+            currentValue = evaluator.applyMove(routerIndex, newPosition)
+
+    return evaluator.solution, currentValue, best.solution, best.value, blueprint.evaluations - evaluations
+
+
+def swapReplicas(solutions, values, temperatures, parity):
+    """
+    Proposes swapping the solutions of neighbouring temperatures (pairs starting at 'parity', 0 or 1), accepting each
+    swap with the Metropolis criterion: min(1, e^((1/T_i - 1/T_j) * (value_j - value_i))), T_i < T_j.
+    A better solution at the higher temperature always moves down.
+    :return: Number of swaps made
+    """
+    swaps = 0
+    for i in range(parity, len(temperatures) - 1, 2):
+        exponent = (1 / temperatures[i] - 1 / temperatures[i + 1]) * (values[i + 1] - values[i])
+        if exponent >= 0 or random.uniform(0, 1) < math.exp(exponent):
+            solutions[i], solutions[i + 1] = solutions[i + 1], solutions[i]
+            values[i], values[i + 1] = values[i + 1], values[i]
+            swaps += 1
+    return swaps
+
+
+def parallelTempering(blueprint, solution, replicas=os.cpu_count(), temperatures=None, swapInterval=200, rounds=50,
+                      timeLimit=None, maxEvaluations=None, callback=None):
+    """
+    Parallel tempering (see 'parallelTemperingSteps'), run until it ends.
+    Returns the best solution found, and reports each improvement to 'callback(solution, value)'.
+    """
+    return run(parallelTemperingSteps(blueprint, solution, replicas, temperatures, swapInterval, rounds, timeLimit,
+                                      maxEvaluations), callback, "Parallel tempering")
+
+
+def parallelTemperingSteps(blueprint, solution, replicas=os.cpu_count(), temperatures=None, swapInterval=200,
+                           rounds=50, timeLimit=None, maxEvaluations=None):
+    """
+    Parallel tempering (replica exchange): 'replicas' copies of the solution are annealed at fixed temperatures, each
+    one in its own process. Every 'swapInterval' moves, replicas at neighbouring temperatures swap their solutions
+    (see 'swapReplicas'), so good solutions sink to the cold replicas and the hot ones keep exploring.
+    Configuration:  - temperatures: ascending list, one per replica (default: 'temperatureLadder', 10 to 10000)
+                    - 'rounds' rounds of 'swapInterval' moves per replica
+    Stops earlier if 'timeLimit' (in seconds) or 'maxEvaluations' is reached (each replica gets an equal share of the
+    evaluations left).
+    Generator: yields a step (see 'anytime.Step') after each round, with the best solution of the round, and returns
+    the best solution found.
+    """
+    if temperatures is None:
+        temperatures = temperatureLadder(max(2, replicas))
+    temperatures = sorted(temperatures)
+    replicas = len(temperatures)
+    budget = Budget(blueprint, timeLimit, maxEvaluations)
+    best = BestSoFar()
+    best.update(solution, value(blueprint, solution))
+    yield Step(0, best.value, solution, budget.evaluations())
+
+    def replicaBudget():
+        # Time and evaluations left for each replica
+        evaluations = budget.remainingEvaluations()
+        return budget.remainingTime(), None if evaluations is None else evaluations // replicas
+
+    solutions = [solution] * replicas
+    with multiprocessing.Pool(replicas, initializer=parallel.initWorker, initargs=(blueprint,)) as pool:
+        iteration = 0
+        while iteration < rounds and not budget.exhausted():
+            seeds = [random.randrange(2 ** 32) for _ in range(replicas)]
+            results = pool.map(annealReplica, [(solutions[i], temperatures[i], swapInterval, seeds[i]) + replicaBudget()
+                                               for i in range(replicas)])
+            solutions = [replicaSolution for (replicaSolution, _, _, _, _) in results]
+            values = [replicaValue for (_, replicaValue, _, _, _) in results]
+            blueprint.evaluations += sum(evaluations for (_, _, _, _, evaluations) in results)
+
+            (_, _, roundBest, roundBestValue, _) = max(results, key=lambda result: result[3])
+            best.update(roundBest, roundBestValue)
+            swapReplicas(solutions, values, temperatures, iteration % 2)
+            iteration += 1
+            yield Step(iteration, best.value, roundBest, budget.evaluations())
+
+    return best.solution
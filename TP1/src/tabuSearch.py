@@ -2,6 +2,9 @@ import time
 import blueprint as bp
 from utils import *
 import utils
+from evaluator import IncrementalEvaluator
+from parallel import NeighbourhoodEvaluator
+from anytime import Budget, BestSoFar, Step, run
 
 
 def getTabuStructure(blueprint,solution):
@@ -30,87 +33,129 @@ def getTabuStructure(blueprint,solution):
     return dict
 
 
-def tabuSearch(blueprint, solution):
+def tabuSearch(blueprint, solution, workers=1, timeLimit=None, maxEvaluations=None, callback=None):
+    """
+    Tabu search (see 'tabuSearchSteps'), run until it ends.
+    :param callback: Function called with each improvement of the best solution: callback(solution, value)
+    :return: Returns the best found solution of router coords
+    """
+    return run(tabuSearchSteps(blueprint, solution, workers, timeLimit, maxEvaluations), callback, "Tabu search")
+
+
+def tabuSearchSteps(blueprint, solution, workers=1, timeLimit=None, maxEvaluations=None):
     """
     Implementation of tabu search algorithm.
+    The value of each move is cached, as a difference to the current value. After a move, only the moves of the
+    routers near it (see 'affectedRouters') are scored again, so an iteration scores the neighbourhood of the change
+    instead of every move. Moves far away keep their cached difference, which only misses the small change of their
+    backbone cost, so a move is scored exactly before it's made, unless it was scored in the same iteration.
+    Generator: yields a step (see 'anytime.Step') after each iteration, and returns the best found solution.
     :param blueprint:
     :param solution:
+    :param workers: Number of processes scoring the neighbours
+    :param timeLimit: If it's reached (in seconds), the search stops earlier
+    :param maxEvaluations: If it's reached, the search stops earlier (checked after each neighbourhood)
     :return: Returns the best found solution of router coords
     """
 
     tabuTenure = 10
     tabuStructure = getTabuStructure(blueprint, solution)
-    bestSolution = solution
-    bestValue = value(blueprint, bestSolution)
-    currentSolution = solution
-    currentValue = value(blueprint, currentSolution)
+    # Keys of the tabu structure of each router
+    routerMoves = {}
+    for key in tabuStructure:
+        routerMoves.setdefault(key[0], []).append(key)
+    # Cached value of each move, minus the current value (None if the move isn't valid or exceeds the budget)
+    moveDeltas = {}
+    # Neighbours only differ in one router, so they are scored by delta
+    evaluator = IncrementalEvaluator(blueprint, solution)
+    best = BestSoFar()
+    best.update(solution, evaluator.value)
+    currentValue = evaluator.value
+
+    def moveOf(key):
+        return key[0], movedRouter(evaluator.solution[key[0]], key[1], key[2])
+
+    def makeMove(key):
+        # Makes the move (sent to the workers of 'neighbourhood', below) and forgets the cached values of the moves it
+        # can change
+        (routerIndex, newPosition) = moveOf(key)
+        oldPosition = evaluator.solution[routerIndex]
+        lastIx = getIndexOfLastNonEmptyRouter(evaluator.solution)
+        newValue = neighbourhood.applyMove(evaluator, routerIndex, newPosition)
+        changed = [oldPosition] if newPosition == (-1, -1) else [oldPosition, newPosition]
+        # A removal moves the last router to 'routerIndex', so the moves of both indices change
+        for i in affectedRouters(blueprint, evaluator.solution, changed) | {routerIndex, lastIx}:
+            for moveKey in routerMoves.get(i, []):
+                moveDeltas.pop(moveKey, None)
+        return newValue
 
     iter = 1
     terminate = 0
-    while terminate < 50:
-        print('\n\n### Iteration {} ###  Current Value: {}, Best Value: {}'.format(iter, currentValue, bestValue))
-        
-        number = 0
-        
-        # searching all the possible neighbours for the current solution
-        for i in tabuStructure:
-            candidateSolution, candidateValue = utils.neighbour(blueprint, currentSolution, i[0], i[1], i[2], i[3])
-            if candidateValue is not None:
-                tabuStructure[i]['MoveValue'] = candidateValue
-            else: 
-                tabuStructure[i]['MoveValue'] = 0
-
-    
-        while True:
-            # selecting the move with the highest value from all neighbours
-            bestMove = max(tabuStructure, key=lambda x: tabuStructure[x]['MoveValue'])
-            moveValue = tabuStructure[bestMove]["MoveValue"]
-            tabuTime = tabuStructure[bestMove]["tabuTime"]
-
-            # not in the tabu list
-            if tabuTime < iter:
-                
-                # make the move
-                currentSolution, currentValue = utils.neighbour(blueprint, currentSolution, bestMove[0], bestMove[1], bestMove[2], bestMove[3])
-                if currentValue is None:
-                    currentValue = 0
-                
-                if moveValue > bestValue:
-                    bestSolution = currentSolution
-                    bestValue = currentValue
-                    print("   Best Move: {}, Value: {} => Best Improving => Admissible".format(bestMove, currentValue))
-                    terminate = 0
-                
-                # update tabu time for the move
+    budget = Budget(blueprint, timeLimit, maxEvaluations)
+    yield Step(0, best.value, evaluator.solution, budget.evaluations())
+    with NeighbourhoodEvaluator(blueprint, workers) as neighbourhood:
+        while terminate < 50 and not budget.exhausted():
+            # scoring the neighbours whose value isn't cached
+            scored = [key for key in tabuStructure if key not in moveDeltas]
+            scoredValues = neighbourhood.evaluateMoves(evaluator, [moveOf(key) for key in scored])
+            for (key, candidateValue) in zip(scored, scoredValues):
+                moveDeltas[key] = None if candidateValue is None else candidateValue - currentValue
+            scored = set(scored)
+            for key in tabuStructure:
+                if moveDeltas[key] is not None:
+                    tabuStructure[key]['MoveValue'] = currentValue + moveDeltas[key]
                 else:
-                    print("   ## Termination: {} ## Best Move: {}, Value: {} => Least non-improving => " "Admissible".
-                          format(terminate, bestMove, currentValue))
-                    terminate += 1
-
-                tabuStructure[bestMove]['tabuTime'] = iter + tabuTenure
-                iter += 1
-                break
-
-            # in tabu
-            else:
-
-                    
-                if moveValue > bestValue:
-                    
-                    # make the move
-                    currentSolution, currentValue = utils.neighbour(blueprint, currentSolution, bestMove[0], bestMove[1], bestMove[2], bestMove[3])
-                    bestSolution = currentSolution
-                    bestValue = currentValue
-                    print("   Best Move: {}, Value: {} => Aspiration => Admissible".format(bestMove, currentValue))
-                    terminate = 0
+                    tabuStructure[key]['MoveValue'] = 0
+
+            while True:
+                # selecting the move with the highest value from all neighbours
+                bestMove = max(tabuStructure, key=lambda x: tabuStructure[x]['MoveValue'])
+                moveValue = tabuStructure[bestMove]["MoveValue"]
+                tabuTime = tabuStructure[bestMove]["tabuTime"]
+
+                # a cached value is checked before the move is made (an admissible move with a valid value)
+                if moveValue > 0 and (tabuTime < iter or moveValue > best.value) and bestMove not in scored:
+                    scored.add(bestMove)
+                    exactValue = evaluator.evaluateMove(*moveOf(bestMove))
+                    moveDeltas[bestMove] = None if exactValue is None else exactValue - currentValue
+                    if exactValue != moveValue:
+                        tabuStructure[bestMove]['MoveValue'] = 0 if exactValue is None else exactValue
+                        continue
+
+                # not in the tabu list
+                if tabuTime < iter:
+
+                    # make the move (only if it leads to a valid solution within the budget)
+                    if moveValue > 0:
+                        currentValue = makeMove(bestMove)
+
+                    if moveValue > best.value:
+                        best.update(evaluator.solution, currentValue)
+                        terminate = 0
+
+                    # update tabu time for the move
+                    else:
+                        terminate += 1
+
+                    tabuStructure[bestMove]['tabuTime'] = iter + tabuTenure
                     iter += 1
                     break
+
+                # in tabu
                 else:
-                    tabuStructure[bestMove]["MoveValue"] = float('-inf')
-                    terminate += 1
-                    print("   Best Move: {}, Value: {} => Tabu => Inadmissible".format(bestMove, currentValue))
-                    break
-                
-    print('\n', '#' * 50, "Performed iterations: {}".format(iter), "Best found Solution: {} , Value: {}".
-          format(bestSolution, bestValue), sep="\n")
-    return bestSolution
\ No newline at end of file
+                    if moveValue > best.value:
+
+                        # make the move
+                        currentValue = makeMove(bestMove)
+                        best.update(evaluator.solution, currentValue)
+                        terminate = 0
+                        iter += 1
+                        break
+                    else:
+                        tabuStructure[bestMove]["MoveValue"] = float('-inf')
+                        terminate += 1
+                        break
+
+            yield Step(iter, best.value, evaluator.solution, budget.evaluations())
+
+    return best.solution
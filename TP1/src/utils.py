@@ -2,6 +2,13 @@ from math import *
 import functools
 import random
 import heapq
+import numpy as np
+from instrumentation import instrumented
+from anytime import Budget
+from backbone import Backbone
+
+# Memory used by the coverage masks of 'evaluatePopulation', in bytes
+POPULATION_MASKS_MEMORY = 64 * 1024 * 1024
 
 
 #######################################################################################################################
@@ -9,6 +16,17 @@ import heapq
 #######################################################################################################################
 
 
+def popcount(bits):
+    """
+    Counts the bits set in an integer (a bitset).
+    """
+    return bin(bits).count("1")
+
+
+if hasattr(int, "bit_count"):  # Python 3.10+
+    popcount = int.bit_count
+
+
 def distance(pointA, pointB):
     """
     Calculates the distance between 2 points.
@@ -56,13 +74,15 @@ def printGrid(grid):
 #######################################################################################################################
 
 
+@instrumented("value")
 def value(blueprint, solution):
     """
     Calculates and returns the value of a solution.
     :return: Value of a solution. If the value exceeds the budget, returns None
     """
-    t = len(blueprint.getSolutionCoveredCells(solution))  # t = number of cells covered by wireless connection
-    N = len(blueprint.accessMstPathsDict(solution))  # N = Number of cells connected to the backbone
+    blueprint.evaluations += 1
+    t = blueprint.getSolutionCoveredCellsCount(solution)  # t = number of cells covered by wireless connection
+    N = blueprint.accessMstDict(solution).weight  # N = Number of cells connected to the backbone
     M = routersPlaced(solution)  # M = Number of routers
     remainingBudget = blueprint.budget - (N * blueprint.backboneCost + M * blueprint.routerCost)
     if remainingBudget < 0:
@@ -70,12 +90,49 @@ def value(blueprint, solution):
     return 1000 * t + remainingBudget
 
 
+@instrumented("evaluatePopulation")
+def evaluatePopulation(blueprint, population):
+    """
+    Calculates the values of several solutions at once. Each value is cached, so it's never computed twice.
+    The covered cells of the solutions not cached are counted in boolean masks, one row per solution.
+    :return: NumPy array with the value of each solution. If the value exceeds the budget, it's -inf
+    """
+    values = np.empty(len(population))
+    pending = []
+    for (i, solution) in enumerate(population):
+        try:
+            values[i] = blueprint.fitness[tuple(solution)]
+        except KeyError:
+            pending.append(i)
+    blueprint.evaluations += len(pending)
+
+    cells = blueprint.height * blueprint.width
+    chunk = max(1, POPULATION_MASKS_MEMORY // cells)
+    for start in range(0, len(pending), chunk):
+        indices = pending[start:start + chunk]
+        masks = np.zeros((len(indices), cells), dtype=bool)
+        for (row, i) in enumerate(indices):
+            coverage = [blueprint.accessCoverageIndicesDict(router) for router in population[i] if router != (-1, -1)]
+            if coverage:
+                masks[row, np.concatenate(coverage)] = True
+        covered = np.count_nonzero(masks, axis=1)  # t = number of cells covered by wireless connection
+
+        for (row, i) in enumerate(indices):
+            solution = population[i]
+            N = blueprint.accessMstDict(solution).weight  # N = Number of cells connected to the backbone
+            M = routersPlaced(solution)  # M = Number of routers
+            remainingBudget = blueprint.budget - (N * blueprint.backboneCost + M * blueprint.routerCost)
+            values[i] = 1000 * int(covered[row]) + remainingBudget if remainingBudget >= 0 else -inf
+            blueprint.fitness[tuple(solution)] = float(values[i])
+    return values
+
+
 def remainingBudget(blueprint, solution):
     """
     Calculates and returns the remaining budget of a solution.
     """
-    t = len(blueprint.getSolutionCoveredCells(solution))  # t = Number of cells covered by wireless connection
-    N = len(blueprint.accessMstPathsDict(solution))  # N = Number of cells connected to the backbone
+    t = blueprint.getSolutionCoveredCellsCount(solution)  # t = Number of cells covered by wireless connection
+    N = blueprint.accessMstDict(solution).weight  # N = Number of cells connected to the backbone
     M = routersPlaced(solution)  # M = Number of routers
     return blueprint.budget - (N * blueprint.backboneCost + M * blueprint.routerCost)
 
@@ -115,43 +172,46 @@ def validSolution(blueprint, solution):  # doesn't check budget
     return True
 
 
-def generateSolution(blueprint):
+def generateSolution(blueprint, timeLimit=None, maxEvaluations=None):
     """
     Generates a solution using the maximum number of routers,
-    given the path to all routers and the budget available
+    given the path to all routers and the budget available.
+    Routers are added in random positions until all target cells are covered or the next one exceeds the budget. The
+    coverage (a bitset) and the backbone tree are updated with each router, instead of evaluating the whole solution.
+    Stops earlier, with the routers added so far, if 'timeLimit' (in seconds) or 'maxEvaluations' is reached.
     :param blueprint:
     :return: Returns the created solution
     """
 
+    budget = Budget(blueprint, timeLimit, maxEvaluations)
+    backbone = Backbone(blueprint)
+    coverage = 0  # bitset of the covered cells
     individualSol = []
     positionsAdded = {}
-    while True:
-        for j in range(blueprint.getMaxRouters()):  # iterate the total number of available routers
-            rand = random.randint(0, len(blueprint.validPositions) - 1)
-
-            while True:
-                try:
-                    positionsAdded[rand]  # does not add duplicate coords
-                except KeyError:
-                    break
-                rand = random.randint(0, len(blueprint.validPositions) - 1)
-                continue
-
-            individualSol.append(blueprint.validPositions[rand])
-            positionsAdded[rand] = True
-
-            if blueprint.targetCoveredCells == len(blueprint.getSolutionCoveredCells(individualSol)):  # if all target cells are covered
-                while len(individualSol) < blueprint.getMaxRouters():  # until solution has the correct size
-                    individualSol.append((-1, -1))  # add non present routers
-                break
+    while len(individualSol) < blueprint.getMaxRouters() and len(positionsAdded) < len(blueprint.validPositions):
+        if budget.exhausted():
+            break
+        rand = random.randint(0, len(blueprint.validPositions) - 1)
+        if rand in positionsAdded:  # does not add duplicate coords
+            continue
+        positionsAdded[rand] = True
+        router = blueprint.validPositions[rand]
 
-            if value(blueprint, individualSol) is None:  # if the new solution exceeds the budget
-                individualSol.pop()  # removes the last router
-                while len(individualSol) < blueprint.getMaxRouters():  # until solution it has the correct size
-                    individualSol.append((-1, -1))  # add non present routers
-                break
+        blueprint.evaluations += 1
+        backbone.addTerminal(router)
+        if blueprint.budget - (backbone.weight * blueprint.backboneCost +
+                               (len(individualSol) + 1) * blueprint.routerCost) < 0:  # if the new router exceeds the budget
+            break
+        individualSol.append(router)
+
+        (lowestBit, bits) = blueprint.accessCoverageBitsDict(router)
+        coverage |= bits << lowestBit
+        if blueprint.targetCoveredCells == popcount(coverage):  # if all target cells are covered
+            break
 
-        return individualSol
+    while len(individualSol) < blueprint.getMaxRouters():  # until solution has the correct size
+        individualSol.append((-1, -1))  # add non present routers
+    return individualSol
 
 
 def getIndexOfLastNonEmptyRouter(solution) -> int:
@@ -163,9 +223,10 @@ def getIndexOfLastNonEmptyRouter(solution) -> int:
             return len(solution) - i - 1
 
 
-def randomNeighbour(blueprint, solution: list, remove=False):  # can return an infeasible solution
+def randomMove(solution):
     """
-    Given a solution, returns a random neighbour and the respective value.
+    Given a solution, chooses a random router and a random direction to move it.
+    :return: The index of the router and its new position.
     """
 
     routerChange = random.randint(0, getIndexOfLastNonEmptyRouter(solution))
@@ -177,6 +238,16 @@ def randomNeighbour(blueprint, solution: list, remove=False):  # can return an i
             continue
         break
 
+    return routerChange, (solution[routerChange][0] + upOrDownX, solution[routerChange][1] + upOrDownY)
+
+
+def randomNeighbour(blueprint, solution: list, remove=False):  # can return an infeasible solution
+    """
+    Given a solution, returns a random neighbour and the respective value.
+    """
+
+    routerChange, newPosition = randomMove(solution)
+
     neighbour = solution.copy()
 
     if remove:  # by default = false
@@ -184,7 +255,7 @@ def randomNeighbour(blueprint, solution: list, remove=False):  # can return an i
         neighbour[routerChange] = neighbour[lastIx]
         neighbour[lastIx] = (-1, -1)
     else:
-        neighbour[routerChange] = (neighbour[routerChange][0] + upOrDownX, neighbour[routerChange][1] + upOrDownY)  # create the new solution wiht the randomly generated coords
+        neighbour[routerChange] = newPosition  # create the new solution wiht the randomly generated coords
 
     if not validSolution(blueprint, neighbour):  # if solution is not correct
         return None, None
@@ -194,6 +265,31 @@ def randomNeighbour(blueprint, solution: list, remove=False):  # can return an i
     return neighbour, neighbourValue
 
 
+def movedRouter(router, coordToChange, upOrDown):
+    """
+    Returns the new position of a router, according to the same instructions as 'neighbour'.
+    :param coordToChange: 0 or 1, 0 changes x, 1 changes y
+    :param upOrDown: 1 increments, 0 decrements, -1 removes the router (returns (-1, -1))
+    """
+    if upOrDown == -1:
+        return (-1, -1)
+    add = 1 if upOrDown == 1 else -1
+    if coordToChange == 0:
+        return (router[0] + add, router[1])
+    return (router[0], router[1] + add)
+
+
+def affectedRouters(blueprint, solution, positions):
+    """
+    Finds the routers whose moves can change value when the routers in 'positions' change: the coverage of the router,
+    before or after a move of 1 cell, overlaps the coverage of one of the positions.
+    :return: Set of router indices
+    """
+    distance = 2 * blueprint.routerRadius + 2
+    return {i for (i, router) in enumerate(solution) if router != (-1, -1) and
+            any(max(abs(router[0] - position[0]), abs(router[1] - position[1])) <= distance for position in positions)}
+
+
 def neighbour(blueprint, solution, routerToChange, coordToChange, upOrDown, numRouters, calcValue = True):
     """
     Generates a neighbour to the current solution, according to the instructions given